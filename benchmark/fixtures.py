@@ -0,0 +1,151 @@
+"""
+Generate synthetic corpora for the replay server.
+They follow the response formats of api.php, VocaDB and bilibili closely enough for the scripts to run.
+pywikibot itself is replaced by benchmark/wiki_stub.py in the scenarios that use it.
+"""
+import argparse
+import json
+import random
+from datetime import datetime, timedelta
+from pathlib import Path
+
+FIXTURE_PATH = Path(__file__).parent.joinpath("fixtures")
+BENCH_USER = "BenchUser"
+BENCH_PRODUCER = "1"
+BENCH_UID = 1
+SYNTHETIC_CORPORA = ["mediawiki", "vocadb", "bilibili"]
+
+
+def random_timestamp(rng: random.Random, start: datetime, end: datetime) -> datetime:
+    return start + timedelta(seconds=rng.randrange(int((end - start).total_seconds())))
+
+
+def format_timestamp(d: datetime) -> str:
+    return d.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def exchange(host: str, path: str, query: dict, body, content_type: str = "application/json") -> dict:
+    return {'host': host, 'path': path, 'query': [[k, str(v)] for k, v in query.items()], 'status': 200,
+            'content_type': content_type, 'body': body if isinstance(body, str) else json.dumps(body)}
+
+
+def make_mediawiki_corpus(rng: random.Random, scale: int) -> dict:
+    start, end = datetime(2016, 1, 1), datetime(2022, 12, 31)
+    contributions = []
+    for i in range(5000 * scale):
+        contribution = {'userid': 1, 'user': BENCH_USER, 'pageid': i, 'revid': i, 'parentid': 0,
+                        'ns': rng.choice([0, 0, 0, 1, 2, 10, 14]), 'title': f"Page {i}",
+                        'timestamp': format_timestamp(random_timestamp(rng, start, end)), 'tags': []}
+        if rng.random() < 0.1:
+            contribution['new'] = ''
+        contributions.append(contribution)
+    events = []
+    users = {}
+    for i in range(400 * scale):
+        username = f"User{i}"
+        registration = random_timestamp(rng, start, end - timedelta(days=365))
+        users[username] = {'userid': i, 'name': username, 'registration': format_timestamp(registration)}
+        timestamp = registration
+        groups = []
+        for _ in range(rng.randint(1, 5)):
+            timestamp += timedelta(days=rng.randint(1, 120))
+            new_groups = rng.choice([['goodeditor'], ['patroller'], ['honoredmaintainer'], []])
+            events.append({'logid': len(events), 'ns': 2, 'title': "User:" + username, 'pageid': 0, 'logpage': 0,
+                           'params': {'oldgroups': groups, 'newgroups': new_groups},
+                           'type': 'rights', 'action': 'rights', 'user': 'Admin',
+                           'timestamp': format_timestamp(timestamp), 'comment': f"reason {len(events)}"})
+            groups = new_groups
+    pages = {}
+    for i in range(200 * scale):
+        size = 0
+        revisions = []
+        for _ in range(rng.randint(1, 30)):
+            size = max(0, size + rng.randint(-2000, 5000))
+            revisions.append({'user': f"User{rng.randrange(400 * scale)}", 'size': size,
+                              'tags': ['mw-undo'] if rng.random() < 0.05 else []})
+        pages[f"Article {i}"] = revisions
+    return {'mediawiki': {'usercontribs': {BENCH_USER: contributions}, 'logevents': events, 'users': users,
+                          'pages': pages}}
+
+
+def make_vocadb_corpus(rng: random.Random, scale: int) -> dict:
+    exchanges = []
+    song_count = 60 * scale
+    page_size = 50
+    for start in range(0, song_count + 1, page_size):
+        items = [{'id': i, 'version': 1} for i in range(start, min(start + page_size, song_count))]
+        exchanges.append(exchange("vocadb.net", "/api/songs", {
+            'start': start, 'query': "", 'maxResults': page_size, 'sort': 'PublishDate',
+            'artistId[]': BENCH_PRODUCER, 'artistParticipationStatus': 'Everything'}, {'items': items}))
+    for i in range(song_count):
+        publish_date = random_timestamp(rng, datetime(2010, 1, 1), datetime(2022, 1, 1))
+        exchanges.append(exchange("vocadb.net", f"/api/songs/{i}/details", {}, {
+            'song': {'defaultName': f"曲{i}", 'publishDate': publish_date.strftime("%Y-%m-%dT00:00:00Z"),
+                     'songType': 'Original'},
+            'additionalNames': f"Song {i}, Translation {i}",
+            'pvs': [{'service': 'NicoNicoDouga', 'pvType': 'Original',
+                     'url': f"https://www.nicovideo.jp/watch/sm{i}"}],
+            'albums': [], 'artists': [], 'artistString': "Producer feat. 初音ミク"}))
+    exchanges.append(exchange("vocadb.net", "/api/albums", {
+        'start': 0, 'query': "", 'maxResults': 50, 'sort': 'ReleaseDate', 'artistId[]': BENCH_PRODUCER,
+        'artistParticipationStatus': 'OnlyMainAlbums', 'discTypes': 'Album'},
+        {'items': [{'id': i, 'version': 1, 'defaultName': f"Album {i}"} for i in range(3 * scale)]}))
+    return {'exchanges': exchanges}
+
+
+def make_bilibili_corpus(rng: random.Random, scale: int) -> dict:
+    exchanges = [exchange("bilibili.com", "/", {}, "<html></html>", "text/html")]
+    for i in range(60 * scale):
+        for keyword in [f"sm{i}", f"曲{i}"]:
+            results = [{'title': f'<em class="keyword">{keyword}</em> 中文翻译{j}'} for j in range(rng.randint(0, 5))]
+            exchanges.append(exchange("api.bilibili.com", "/x/web-interface/search/type", {
+                'keyword': keyword, 'search_type': 'video', 'duration': 1, 'tids': 3},
+                {'code': 0, 'data': {'result': results}}))
+    video_count = 300 * scale
+    page_size = 50
+    created = int(datetime(2022, 12, 31).timestamp())
+    videos = []
+    for i in range(video_count):
+        created -= rng.randint(3600, 86400 * 3)
+        videos.append({'bvid': f"BV1{i:09d}", 'title': f"原创 Video {i}", 'created': created,
+                       'pic': f"https://i0.hdslb.com/bfs/archive/{i}.jpg"})
+    for pn in range(1, (video_count + page_size - 1) // page_size + 1):
+        exchanges.append(exchange("api.bilibili.com", "/x/space/arc/search", {
+            'mid': BENCH_UID, 'ps': page_size, 'tid': 0, 'pn': pn, 'keyword': "", 'order': 'pubdate'},
+            {'code': 0, 'message': '0', 'data': {
+                'list': {'vlist': videos[(pn - 1) * page_size:pn * page_size]},
+                'page': {'pn': pn, 'ps': page_size, 'count': video_count}}}))
+    return {'exchanges': exchanges}
+
+
+def corpora_scale(path: Path = FIXTURE_PATH) -> int | None:
+    """
+    :return: Scale of the generated corpora, None if some are missing
+    """
+    if not path.joinpath("meta.json").exists() or \
+            any(not path.joinpath(name + ".json").exists() for name in SYNTHETIC_CORPORA):
+        return None
+    with open(path.joinpath("meta.json"), "r", encoding="utf-8") as f:
+        return json.load(f)['scale']
+
+
+def make_corpora(path: Path = FIXTURE_PATH, scale: int = 1, seed: int = 0):
+    path.mkdir(parents=True, exist_ok=True)
+    makers = {'mediawiki': make_mediawiki_corpus, 'vocadb': make_vocadb_corpus, 'bilibili': make_bilibili_corpus}
+    for name, maker in makers.items():
+        with open(path.joinpath(name + ".json"), "w", encoding="utf-8") as f:
+            json.dump(maker(random.Random(seed), scale), f, ensure_ascii=False)
+    with open(path.joinpath("meta.json"), "w", encoding="utf-8") as f:
+        json.dump({'scale': scale, 'seed': seed}, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic replay corpora.")
+    parser.add_argument("--scale", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    make_corpora(scale=args.scale, seed=args.seed)
+
+
+if __name__ == "__main__":
+    main()
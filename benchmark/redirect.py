@@ -0,0 +1,35 @@
+"""
+Point every outgoing requests and httpx call at a local replay server.
+"""
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import httpx
+import requests
+
+
+def rewrite_url(url, port: int) -> str:
+    parts = urlsplit(str(url))
+    if parts.hostname == "127.0.0.1":
+        return str(url)
+    return f"http://127.0.0.1:{port}/{parts.netloc}{parts.path or '/'}" + ("?" + parts.query if parts.query else "")
+
+
+@contextmanager
+def redirect_to(port: int):
+    original_request = requests.Session.request
+    original_async_request = httpx.AsyncClient.request
+
+    def request(self, method, url, *args, **kwargs):
+        return original_request(self, method, rewrite_url(url, port), *args, **kwargs)
+
+    async def async_request(self, method, url, *args, **kwargs):
+        return await original_async_request(self, method, rewrite_url(url, port), *args, **kwargs)
+
+    requests.Session.request = request
+    httpx.AsyncClient.request = async_request
+    try:
+        yield
+    finally:
+        requests.Session.request = original_request
+        httpx.AsyncClient.request = original_async_request
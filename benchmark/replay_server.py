@@ -0,0 +1,245 @@
+"""
+Local HTTP server that replays recorded responses.
+
+Requests are addressed as http://127.0.0.1:<port>/<original host><original path>?<original query>,
+see redirect.py. Responses come from corpus files with two sections:
+  exchanges: recorded responses, matched on host, path and query
+  mediawiki: item lists for list=usercontribs, list=logevents and list=users,
+             paged, bounded and continued like the real api.php,
+             and page revisions for prop=revisions and list=random
+In record mode, requests without a recorded response are forwarded to the original host
+and added to the corpus.
+"""
+import collections
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+# parameters that change between otherwise identical requests
+VOLATILE_PARAMS = {'maxlag', 'requestid', 'curtimestamp', 'wts', 'w_rid', '_'}
+# list module -> parameter prefix
+MEDIAWIKI_LISTS = {'usercontribs': 'uc', 'logevents': 'le'}
+
+
+def exchange_key(host: str, path: str, params: list[tuple[str, str]]) -> str:
+    return host + path + "?" + urlencode(sorted((k, v) for k, v in params if k not in VOLATILE_PARAMS))
+
+
+def in_bounds(timestamp: str, start: str, end: str, newer: bool) -> bool:
+    # api.php bounds are inclusive, and start is the bound the listing begins at
+    if newer:
+        return (start is None or timestamp >= start) and (end is None or timestamp <= end)
+    return (start is None or timestamp <= start) and (end is None or timestamp >= end)
+
+
+class Corpus:
+    def __init__(self):
+        self.exchanges: dict[str, dict] = {}
+        # pages: title -> revisions, oldest first
+        self.mediawiki = {'usercontribs': {}, 'logevents': [], 'users': {}, 'pages': {}}
+
+    def load(self, path: Path):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        for exchange in data.get('exchanges', []):
+            self.add_exchange(exchange)
+        mediawiki = data.get('mediawiki', {})
+        self.mediawiki['usercontribs'].update(mediawiki.get('usercontribs', {}))
+        self.mediawiki['logevents'].extend(mediawiki.get('logevents', []))
+        self.mediawiki['users'].update(mediawiki.get('users', {}))
+        self.mediawiki['pages'].update(mediawiki.get('pages', {}))
+
+    def save(self, path: Path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({'exchanges': list(self.exchanges.values()), 'mediawiki': self.mediawiki},
+                      f, ensure_ascii=False)
+
+    def add_exchange(self, exchange: dict):
+        key = exchange_key(exchange['host'], exchange['path'], [tuple(p) for p in exchange['query']])
+        self.exchanges[key] = exchange
+
+    def find(self, host: str, path: str, params: list[tuple[str, str]]) -> dict | None:
+        exchange = self.exchanges.get(exchange_key(host, path, params))
+        if exchange is not None:
+            return exchange
+        query = dict(params)
+        if path.endswith("api.php") and query.get('action') == 'query':
+            body = self.query_mediawiki(query)
+            if body is not None:
+                return {'status': 200, 'content_type': 'application/json', 'body': json.dumps(body)}
+        return None
+
+    def query_revisions(self, query: dict) -> dict:
+        title = query.get('titles', '')
+        if title not in self.mediawiki['pages']:
+            return {'batchcomplete': '', 'query': {'pages': {'-1': {'ns': 0, 'title': title, 'missing': ''}}}}
+        revisions = self.mediawiki['pages'][title]
+        if query.get('rvdir') != 'newer':
+            revisions = revisions[::-1]
+        limit = query.get('rvlimit', '1')
+        limit = 500 if limit == 'max' else int(limit)
+        offset = int(query.get('rvcontinue', '0'))
+        page_id = str(list(self.mediawiki['pages'].keys()).index(title) + 1)
+        body = {'query': {'pages': {page_id: {'pageid': int(page_id), 'ns': 0, 'title': title,
+                                              'revisions': revisions[offset:offset + limit]}}}}
+        if offset + limit < len(revisions):
+            body['continue'] = {'rvcontinue': str(offset + limit), 'continue': '||'}
+        else:
+            body['batchcomplete'] = ''
+        return body
+
+    def query_mediawiki(self, query: dict) -> dict | None:
+        if query.get('prop') == 'revisions':
+            return self.query_revisions(query)
+        list_name = query.get('list', '')
+        if list_name == 'random':
+            # deterministic, so that runs are comparable
+            titles = list(self.mediawiki['pages'].keys())[:int(query.get('rnlimit', '1'))]
+            return {'batchcomplete': '', 'query': {'random': [{'ns': 0, 'title': t} for t in titles]}}
+        if list_name == 'users':
+            users = [self.mediawiki['users'].get(name, {'name': name, 'missing': ''})
+                     for name in query.get('ususers', '').split('|')]
+            return {'batchcomplete': '', 'query': {'users': users}}
+        if list_name not in MEDIAWIKI_LISTS:
+            return None
+        prefix = MEDIAWIKI_LISTS[list_name]
+        if list_name == 'usercontribs':
+            items = self.mediawiki['usercontribs'].get(query.get('ucuser', ''), [])
+            if 'new' in query.get('ucshow', ''):
+                items = [item for item in items if 'new' in item]
+        else:
+            items = [item for item in self.mediawiki['logevents']
+                     if query.get('letype') is None or item['type'] == query['letype']]
+        newer = query.get(prefix + 'dir') == 'newer'
+        items = sorted(items, key=lambda item: item['timestamp'], reverse=not newer)
+        items = [item for item in items
+                 if in_bounds(item['timestamp'], query.get(prefix + 'start'), query.get(prefix + 'end'), newer)]
+        limit = query.get(prefix + 'limit', '10')
+        limit = 500 if limit == 'max' else int(limit)
+        offset = int(query.get(prefix + 'continue', '0'))
+        body = {'batchcomplete': '', 'query': {list_name: items[offset:offset + limit]}}
+        if offset + limit < len(items):
+            body['continue'] = {prefix + 'continue': str(offset + limit), 'continue': '-||'}
+        return body
+
+
+class ReplayServer:
+    def __init__(self, corpus_paths: list[Path], latency: float = 0.0, record_to: Path = None, port: int = 0):
+        """
+        :param corpus_paths: Corpus files to replay
+        :param latency: Seconds to wait before answering each request
+        :param record_to: Forward unknown requests and save the resulting corpus here
+        :param port: Port to listen on, 0 picks a free one
+        """
+        self.corpus = Corpus()
+        for path in corpus_paths:
+            self.corpus.load(path)
+        self.latency = latency
+        self.record_to = record_to
+        self.lock = threading.Lock()
+        self.requests = collections.Counter()
+        self.misses = collections.Counter()
+        self.bytes_sent = 0
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), self.make_handler())
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self.httpd.server_address[1]
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.record_to is not None:
+            self.corpus.save(self.record_to)
+
+    def reset_stats(self):
+        with self.lock:
+            self.requests.clear()
+            self.misses.clear()
+            self.bytes_sent = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {'requests': sum(self.requests.values()),
+                    'misses': sum(self.misses.values()),
+                    'bytes': self.bytes_sent,
+                    'endpoints': dict(self.requests),
+                    'missed_endpoints': dict(self.misses)}
+
+    def record(self, method: str, host: str, path: str, url_params: list[tuple[str, str]], body: bytes,
+               params: list[tuple[str, str]]) -> dict:
+        """
+        Forward a request to the original host and add the response to the corpus.
+        :param params: Query and form parameters together, used as the corpus key
+        """
+        # urllib rather than requests, which redirect.py points back at this server
+        url = f"https://{host}{path}" + ("?" + urlencode(url_params) if url_params else "")
+        request = urllib.request.Request(url, data=body or None, method=method,
+                                         headers={'User-Agent': 'Mozilla/5.0',
+                                                  'Content-Type': 'application/x-www-form-urlencoded'})
+        try:
+            response = urllib.request.urlopen(request)
+        except urllib.error.HTTPError as e:
+            response = e
+        exchange = {'host': host, 'path': path, 'query': params, 'status': response.status,
+                    'content_type': response.headers.get('Content-Type', 'application/json'),
+                    'body': response.read().decode("utf-8", errors="replace")}
+        with self.lock:
+            self.corpus.add_exchange(exchange)
+        return exchange
+
+    def make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def handle_request(self, method: str):
+                parts = urlsplit(self.path)
+                host, _, path = parts.path.lstrip("/").partition("/")
+                path = "/" + path
+                url_params = parse_qsl(parts.query, keep_blank_values=True)
+                params = list(url_params)
+                body = b""
+                if method == "POST":
+                    body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+                    if self.headers.get('Content-Type', '').startswith('application/x-www-form-urlencoded'):
+                        params += parse_qsl(body.decode(), keep_blank_values=True)
+                if server.latency > 0:
+                    time.sleep(server.latency)
+                exchange = server.corpus.find(host, path, params)
+                if exchange is None and server.record_to is not None:
+                    exchange = server.record(method, host, path, url_params, body, params)
+                with server.lock:
+                    server.requests[host + path] += 1
+                    if exchange is None:
+                        server.misses[host + path] += 1
+                if exchange is None:
+                    self.send_error(404, "No recorded response for " + exchange_key(host, path, params))
+                    return
+                payload = exchange['body'].encode()
+                with server.lock:
+                    server.bytes_sent += len(payload)
+                self.send_response(exchange['status'])
+                self.send_header('Content-Type', exchange['content_type'])
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def do_GET(self):
+                self.handle_request("GET")
+
+            def do_POST(self):
+                self.handle_request("POST")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,159 @@
+"""
+Offline benchmarks. Run from the repository root:
+
+    python -m benchmark.run [scenario ...] [--latency 0.05] [--json report.json]
+
+Scenarios run against a local replay server (replay_server.py) instead of moegirl, VocaDB and bilibili,
+each in a temporary working directory so that caches from earlier runs do not interfere.
+Synthetic corpora are generated on first use (fixtures.py), and again when --scale asks for another size.
+The revisions and rights scenarios replace pywikibot with wiki_stub.py, which queries the same corpus.
+--record NAME forwards requests without a response in the corpora to the real sites
+and saves the corpora together with these responses to fixtures/NAME.json.
+"""
+import argparse
+import builtins
+import importlib
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable
+
+from benchmark.fixtures import FIXTURE_PATH, BENCH_USER, BENCH_PRODUCER, BENCH_UID, make_corpora, corpora_scale
+from benchmark.redirect import redirect_to
+from benchmark.replay_server import ReplayServer
+from benchmark.wiki_stub import stub_pywikibot
+
+
+@dataclass
+class Scenario:
+    name: str
+    corpora: list[str]
+    # imported before timing starts
+    modules: list[str]
+    run: Callable[[argparse.Namespace], object]
+
+
+def run_usercontribs(args: argparse.Namespace):
+    from user_contrib import get_contributions_on_mgp
+    return get_contributions_on_mgp(BENCH_USER, False)
+
+
+def run_revisions(args: argparse.Namespace):
+    from contributor_statistics import get_user_contributions
+    Path("data").mkdir(exist_ok=True)
+    with stub_pywikibot():
+        return get_user_contributions(args.pages)
+
+
+def run_rights(args: argparse.Namespace):
+    from good_editor_history import get_user_right_history
+    with stub_pywikibot():
+        return get_user_right_history()
+
+
+def run_template(args: argparse.Namespace):
+    import sessions
+    import vocadb_cache
+    from mgp_common.config import set_cache_path
+    from vocaloid_producer_template import make_template
+    set_cache_path("cache")
+    # the store lives in the temporary cache folder
+    vocadb_cache.store = None
+    Path("cache").mkdir()
+    original_input = builtins.input
+    # keep every original title
+    builtins.input = lambda *_: ""
+    try:
+        return make_template(BENCH_PRODUCER)
+    finally:
+        builtins.input = original_input
+        # the session belongs to the temporary directory, don't save its cookies into the working tree
+        sessions.sessions.clear()
+
+
+def run_user_videos(args: argparse.Namespace):
+    from vtuber_songs import get_user_videos
+    return list(get_user_videos(BENCH_UID))
+
+
+SCENARIOS = [
+    Scenario("usercontribs", ["mediawiki"], ["user_contrib"], run_usercontribs),
+    # stub_pywikibot patches both modules and pywikibot, so all of them are imported up front
+    Scenario("revisions", ["mediawiki"], ["contributor_statistics", "good_editor_history"], run_revisions),
+    Scenario("rights", ["mediawiki"], ["good_editor_history", "contributor_statistics"], run_rights),
+    Scenario("template", ["vocadb", "bilibili"], ["vocaloid_producer_template"], run_template),
+    Scenario("user_videos", ["bilibili"], ["vtuber_songs"], run_user_videos),
+]
+
+
+def run_scenario(scenario: Scenario, args: argparse.Namespace) -> dict:
+    corpus_paths = [FIXTURE_PATH.joinpath(name + ".json") for name in scenario.corpora]
+    record_to = FIXTURE_PATH.joinpath(args.record + ".json") if args.record else None
+    missing = [str(p) for p in corpus_paths if not p.exists() and p != record_to]
+    if len(missing) > 0:
+        return {'scenario': scenario.name, 'skipped': "missing corpus " + ", ".join(missing)}
+    for module in scenario.modules:
+        importlib.import_module(module)
+    server = ReplayServer([p for p in corpus_paths if p.exists()], latency=args.latency, record_to=record_to)
+    server.start()
+    cwd = os.getcwd()
+    try:
+        with tempfile.TemporaryDirectory() as directory, redirect_to(server.port):
+            os.chdir(directory)
+            tracemalloc.start()
+            start = time.perf_counter()
+            scenario.run(args)
+            wall_time = time.perf_counter() - start
+            _, peak_memory = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+    finally:
+        os.chdir(cwd)
+        server.stop()
+    stats = server.stats()
+    return {'scenario': scenario.name, 'wall_time': wall_time, 'requests': stats['requests'],
+            'misses': stats['misses'], 'bytes': stats['bytes'], 'peak_memory': peak_memory,
+            'endpoints': stats['endpoints']}
+
+
+def print_report(results: list[dict]):
+    print(f"{'scenario':<14}{'wall time':>12}{'requests':>10}{'misses':>8}{'peak memory':>14}")
+    for r in results:
+        if 'skipped' in r:
+            print(f"{r['scenario']:<14}skipped: {r['skipped']}")
+            continue
+        print(f"{r['scenario']:<14}{r['wall_time']:>11.2f}s{r['requests']:>10}{r['misses']:>8}"
+              f"{r['peak_memory'] / 2 ** 20:>11.1f} MB")
+
+
+def main():
+    names = [s.name for s in SCENARIOS]
+    parser = argparse.ArgumentParser(description="Benchmark scripts against recorded responses.")
+    parser.add_argument("scenarios", nargs="*", choices=[[], *names], help="Defaults to all scenarios.")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response.")
+    parser.add_argument("--pages", type=int, default=50, help="Random pages for the revisions scenario.")
+    parser.add_argument("--scale", type=int, help="Size of generated corpora. Existing corpora are regenerated "
+                                                  "if their size differs, the default keeps them (or uses 1).")
+    parser.add_argument("--record", help="Record missing responses from the real sites into this corpus.")
+    parser.add_argument("--json", help="Also write the report to this file.")
+    args = parser.parse_args()
+    scale = corpora_scale()
+    if scale is None or (args.scale is not None and args.scale != scale):
+        print("Generating synthetic corpora...")
+        make_corpora(scale=args.scale or 1)
+    selected = [s for s in SCENARIOS if len(args.scenarios) == 0 or s.name in args.scenarios]
+    results = []
+    for scenario in selected:
+        print("Running", scenario.name)
+        results.append(run_scenario(scenario, args))
+    print_report(results)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
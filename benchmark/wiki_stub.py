@@ -0,0 +1,115 @@
+"""
+Stand-ins for the parts of pywikibot used by the revisions and rights scenarios.
+
+They query api.php with requests, so under redirect.py the replay server answers them from the synthetic
+mediawiki corpus and no recorded site info is needed. pywikibot's own overhead (site info, throttling,
+response parsing) is not part of these measurements.
+"""
+from contextlib import contextmanager
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Generator
+
+import requests
+
+API_URL = "https://mzh.moegirl.org.cn/api.php"
+
+
+def format_timestamp(d: datetime) -> str:
+    return d.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def query(params: dict) -> Generator[dict, None, None]:
+    """
+    Follow the continuation of an api.php query and yield the response of every request.
+    """
+    params = {'action': 'query', 'format': 'json', **params}
+    while True:
+        response = requests.get(API_URL, params=params).json()
+        yield response
+        if 'continue' not in response:
+            return
+        params.update(response['continue'])
+
+
+class LogEntry:
+    def __init__(self, data: dict):
+        self.data = data
+
+    def timestamp(self) -> datetime:
+        return datetime.strptime(self.data['timestamp'], "%Y-%m-%dT%H:%M:%SZ")
+
+    @property
+    def newgroups(self) -> list[str]:
+        return self.data['params']['newgroups']
+
+    @property
+    def oldgroups(self) -> list[str]:
+        return self.data['params']['oldgroups']
+
+
+class Site:
+    def logevents(self, logtype: str = None, start: datetime = None, end: datetime = None, reverse: bool = False,
+                  total: int = None) -> Generator[LogEntry, None, None]:
+        params = {'list': 'logevents', 'lelimit': 'max', 'ledir': 'newer' if reverse else 'older'}
+        if logtype is not None:
+            params['letype'] = logtype
+        if start is not None:
+            params['lestart'] = format_timestamp(start)
+        if end is not None:
+            params['leend'] = format_timestamp(end)
+        count = 0
+        for response in query(params):
+            for item in response['query']['logevents']:
+                if total is not None and count >= total:
+                    return
+                count += 1
+                yield LogEntry(item)
+
+
+class Page:
+    def __init__(self, site: Site, title: str):
+        self.site = site
+        self._title = title
+
+    def title(self) -> str:
+        return self._title
+
+    def revisions(self, reverse: bool = False) -> Generator[dict, None, None]:
+        for response in query({'prop': 'revisions', 'titles': self._title, 'rvprop': 'user|size|tags',
+                               'rvlimit': 'max', 'rvdir': 'newer' if reverse else 'older'}):
+            for page in response['query']['pages'].values():
+                yield from page.get('revisions', [])
+
+
+def random_pages(page_count: int) -> Generator[Page, None, None]:
+    site = Site()
+    response = next(query({'list': 'random', 'rnnamespace': 0, 'rnlimit': page_count}))
+    for page in response['query']['random']:
+        yield Page(site, page['title'])
+
+
+@contextmanager
+def stub_pywikibot():
+    """
+    Point contributor_statistics and good_editor_history at the stand-ins.
+    """
+    import pywikibot
+    import contributor_statistics
+    import good_editor_history
+    patches = [
+        (contributor_statistics, 'pwb', SimpleNamespace(Site=Site, Page=Page)),
+        (contributor_statistics, 'get_rand_pages', random_pages),
+        # good_editor_history imports Site from pywikibot when it runs
+        (pywikibot, 'Site', Site),
+        # politeness delay between requests to the real site
+        (good_editor_history, 'time', SimpleNamespace(sleep=lambda seconds: None)),
+    ]
+    originals = [(module, name, getattr(module, name)) for module, name, _ in patches]
+    for module, name, value in patches:
+        setattr(module, name, value)
+    try:
+        yield
+    finally:
+        for module, name, value in originals:
+            setattr(module, name, value)
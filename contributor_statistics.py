@@ -7,6 +7,9 @@ from pywikibot.pagegenerators import GeneratorFactory
 from pywikibot.tools import itergroup
 import pywikibot.data.api as api
 
+import instrumentation
+from instrumentation import span, timed
+
 special_user_groups = ['sysop', 'patroller', 'goodeditor', 'honoredmaintainer', 'autoconfirmed', 'user']
 contributions: dict = {}
 FILE_NAME = "data/contributor_statistics_{}.pickle"
@@ -20,6 +23,7 @@ def handle_user(byte_diff: int, groups: list[str]):
     raise RuntimeError("User with undefined rights: " + str(groups))
 
 
+@span()
 def handle_page(page: Page, user_contributions: dict):
     prev_bytes = 0
     for revision in page.revisions(reverse=True):
@@ -39,6 +43,7 @@ def get_rand_pages(page_count: int):
     return gen.getCombinedGenerator(preload=True)
 
 
+@span()
 def handle_user_contributions(user_contributions: dict):
     print(len(user_contributions), "users total.", (len(user_contributions) + 49) // 50, "tries required.")
     for users in itergroup(user_contributions.keys(), 50):
@@ -69,11 +74,15 @@ def get_user_contributions(page_count: int):
     user_contributions_file = Path(FILE_NAME.format("user_contributions_" + str(page_count)))
     if user_contributions_file.exists():
         print("Loading existing user contributions.")
-        user_contributions = pickle.load(open(user_contributions_file, 'rb'))
+        instrumentation.cache_hit("user_contributions")
+        with timed("pickle.load"):
+            user_contributions = pickle.load(open(user_contributions_file, 'rb'))
     else:
+        instrumentation.cache_miss("user_contributions")
         progress_file = Path(FILE_NAME.format("user_contributions_progress_" + str(page_count)))
         if progress_file.exists():
-            page_gen, user_contributions = pickle.load(open(progress_file, 'rb'))
+            with timed("pickle.load"):
+                page_gen, user_contributions = pickle.load(open(progress_file, 'rb'))
             print(len(page_gen), "pages remaining.")
         else:
             page_gen, user_contributions = list(map(lambda p: p.title(), get_rand_pages(page_count))), {}
@@ -83,9 +92,11 @@ def get_user_contributions(page_count: int):
             print("Processing " + page.title())
             handle_page(page, user_contributions)
             page_gen.pop(0)
-            pickle.dump((page_gen, user_contributions), open(progress_file, 'wb'))
+            with timed("pickle.dump"):
+                pickle.dump((page_gen, user_contributions), open(progress_file, 'wb'))
         progress_file.unlink(missing_ok=True)
-        pickle.dump(user_contributions, open(user_contributions_file, 'wb'))
+        with timed("pickle.dump"):
+            pickle.dump(user_contributions, open(user_contributions_file, 'wb'))
     return user_contributions
 
 
@@ -1,19 +1,26 @@
+import functools
 import pickle
 from datetime import  datetime, timedelta
 from pathlib import Path
 
 from pywikibot import Site, APISite, User, Timestamp
 
-mgp: APISite = Site(fam="mgp")
+import instrumentation
+from sharded_crawl import make_shards, crawl_sharded
+
+@functools.cache
+def get_mgp() -> APISite:
+    return Site(fam="mgp")
 
 
 def get_good_editors():
-    return mgp.allusers(group="goodeditor")
+    return get_mgp().allusers(group="goodeditor")
 
 
 CUR_DATE = datetime.now()
 MAINTENANCE_START = datetime(year=2022, month=10, day=11)
 DAY_COUNT = 7
+SHARD_COUNT = 4
 
 
 def in_prev_range(ts: Timestamp):
@@ -24,8 +31,16 @@ def in_cur_range(ts: Timestamp):
     return ts > CUR_DATE + timedelta(days=-DAY_COUNT)
 
 
-def before_acceptable_range(ts: Timestamp):
-    return ts <= MAINTENANCE_START + timedelta(days=-DAY_COUNT)
+def count_contributions(user: User, start: datetime, end: datetime, in_range) -> int:
+    """
+    Count the user's contributions between start and end, crawling the period in concurrent shards.
+    :param in_range: Timestamp -> whether the contribution counts
+    """
+    # each shard only covers part of one window, so there is no need for pywikibot's default cap of 500
+    return sum(1 for _, _, timestamp, _ in
+               crawl_sharded(lambda s, e: user.contributions(total=None, start=e, end=s),
+                             make_shards(start, end, SHARD_COUNT))
+               if in_range(timestamp))
 
 
 def main():
@@ -33,23 +48,21 @@ def main():
     data_path.mkdir(exist_ok=True)
     good_editor_file = data_path.joinpath("good_editors.pickle")
     if good_editor_file.exists():
+        instrumentation.cache_hit("good_editors")
         good_editors = pickle.load(open(good_editor_file, "rb"))
     else:
+        instrumentation.cache_miss("good_editors")
         good_editors = list(get_good_editors())
         with open(good_editor_file, "wb") as f:
             pickle.dump(good_editors, f)
     for editor in good_editors:
         username = editor['name']
-        user = User(source=mgp, title=username)
-        prev_contrib, cur_contrib = 0, 0
-        for c in user.contributions():
-            _, _, timestamp, _ = c
-            if in_prev_range(timestamp):
-                prev_contrib += 1
-            elif in_cur_range(timestamp):
-                cur_contrib += 1
-            elif before_acceptable_range(timestamp):
-                break
+        user = User(source=get_mgp(), title=username)
+        # only the week before maintenance started and the last week are fetched
+        prev_contrib = count_contributions(user, MAINTENANCE_START + timedelta(days=-DAY_COUNT), MAINTENANCE_START,
+                                           in_prev_range)
+        cur_contrib = count_contributions(user, CUR_DATE + timedelta(days=-DAY_COUNT),
+                                          max(CUR_DATE, datetime.utcnow()), in_cur_range)
         print("|-")
         print(f"|-{{{username}}}- || {prev_contrib} || {cur_contrib}")
 
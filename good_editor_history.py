@@ -1,16 +1,20 @@
 import pickle
 import time
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
 from enum import Enum
 from pathlib import Path
-from typing import Iterable
+from typing import Iterable, Optional, TYPE_CHECKING
 
+import numpy as np
 import requests
-from pywikibot import Site
-from pywikibot.logentries import RightsEntry
-from pywikibot.pagegenerators import GeneratorFactory
-from pywikibot.tools import itergroup
+
+import instrumentation
+from instrumentation import span, timed
+from sharded_crawl import make_shards, crawl_sharded
+
+if TYPE_CHECKING:
+    from pywikibot.logentries import RightsEntry
 
 
 class Right(Enum):
@@ -35,6 +39,10 @@ class Right(Enum):
         return "？？？"
 
 
+RIGHTS = list(Right)
+RIGHT_IDS = {r.value: i for i, r in enumerate(RIGHTS)}
+GOOD_EDITOR_ID = RIGHTS.index(Right.GOOD_EDITOR)
+
 
 @dataclass
 class RightChange:
@@ -51,6 +59,9 @@ class UserRight:
     events: list[RightChange]
     registration_date: datetime = datetime.fromtimestamp(0)
     earliest_event: datetime = datetime.fromtimestamp(0)
+    # (start, end, actor, reason) of every goodeditor tenure, filled by process_users
+    periods: list[tuple[datetime, Optional[datetime], str, str]] = field(default_factory=list)
+    current_status: Right = Right.USER
 
 
 def parse_date(d: str) -> datetime:
@@ -58,16 +69,36 @@ def parse_date(d: str) -> datetime:
     return datetime.strptime(d, "%Y-%m-%dT%H:%M:%SZ") + timedelta(hours=8)
 
 
+def get_rights_log(site, shards: int = 8) -> list["RightsEntry"]:
+    first = next(iter(site.logevents(logtype="rights", reverse=True, total=1)), None)
+    if first is None:
+        return []
+    return list(crawl_sharded(lambda start, end: site.logevents(logtype="rights", start=end, end=start),
+                              make_shards(first.timestamp(), datetime.utcnow(), shards)))
+
+
+class RightsUnpickler(pickle.Unpickler):
+    def find_class(self, module, name):
+        # caches written by older versions of `python good_editor_history.py` reference __main__
+        if module == "__main__":
+            module = "good_editor_history"
+        return super().find_class(module, name)
+
+
 def get_user_right_history() -> dict[str, UserRight]:
-    site = Site()
     data_path = Path("data")
     data_path.mkdir(exist_ok=True)
     cache_path = data_path.joinpath("user_rights_logs.txt")
     if not cache_path.exists():
+        instrumentation.cache_miss("user_rights")
+        # pywikibot is only needed when the log is not cached
+        from pywikibot import Site
+        from pywikibot.tools import itergroup
+        site = Site()
         user_rights: dict[str, UserRight] = dict()
-        events = list(site.logevents(logtype="rights"))
+        events = get_rights_log(site)
         for event in events:
-            event: RightsEntry
+            event: "RightsEntry"
             data = event.data
             username = data['title'].replace('User:', '')
             if username not in user_rights:
@@ -93,37 +124,121 @@ def get_user_right_history() -> dict[str, UserRight]:
             for r in response['query']['users']:
                 if 'registration' in r:
                     user_rights[r['name']].registration_date = parse_date(r['registration'])
-        with open(cache_path, "wb") as f:
+        with open(cache_path, "wb") as f, timed("pickle.dump"):
             pickle.dump(user_rights, f)
     else:
-        with open(cache_path, "rb") as f:
-            user_rights = pickle.load(f)
+        instrumentation.cache_hit("user_rights")
+        with open(cache_path, "rb") as f, timed("pickle.load"):
+            user_rights = RightsUnpickler(f).load()
     return user_rights
 
 
+@dataclass
+class EventTable:
+    """
+    Columnar view of right changes, one row per right added to or removed from a user by an event.
+    """
+    user: np.ndarray
+    timestamp: np.ndarray
+    event: np.ndarray
+    right: np.ndarray
+    added: np.ndarray
+
+    def take(self, index) -> "EventTable":
+        return EventTable(self.user[index], self.timestamp[index], self.event[index],
+                          self.right[index], self.added[index])
+
+
+def build_event_table(users: list[UserRight], events: list[RightChange]) -> EventTable:
+    """
+    Build the table with net changes only (rights both added and removed by an event are dropped),
+    sorted by user, timestamp and original event order. Within an event, additions come first.
+    :param users: Users owning the events
+    :param events: Events of all users, in the order of users
+    """
+    event_user = np.repeat(np.arange(len(users)), [len(u.events) for u in users])
+    epoch, microsecond = datetime(1970, 1, 1), timedelta(microseconds=1)
+    event_time = np.array([(e.timestamp - epoch) // microsecond for e in events], dtype=np.int64)
+    # ids of the rights added by every event followed by those removed, -1 for untracked rights
+    added_lists, removed_lists = [e.rights_added for e in events], [e.rights_removed for e in events]
+    added_rights = [RIGHT_IDS.get(r, -1) for rights in added_lists for r in rights]
+    removed_rights = [RIGHT_IDS.get(r, -1) for rights in removed_lists for r in rights]
+    event_ids = np.arange(len(events), dtype=np.int64)
+    event = np.concatenate((np.repeat(event_ids, list(map(len, added_lists))),
+                            np.repeat(event_ids, list(map(len, removed_lists)))))
+    right = np.array(added_rights + removed_rights, dtype=np.int64)
+    added = np.arange(len(right)) < len(added_rights)
+    tracked = right >= 0
+    event, right, added = event[tracked], right[tracked], added[tracked]
+    key = event * len(RIGHTS) + right
+    net = np.where(added, ~np.isin(key, key[~added]), ~np.isin(key, key[added]))
+    event, right, added = event[net], right[net], added[net]
+    user, timestamp = event_user[event], event_time[event]
+    # lexsort is stable, so rights keep their order within an event
+    order = np.lexsort((~added, event, timestamp, user))
+    return EventTable(user, timestamp, event, right, added).take(order)
+
+
+def first_of_runs(values: np.ndarray) -> np.ndarray:
+    return np.concatenate(([True], values[1:] != values[:-1])) if len(values) > 0 else np.zeros(0, dtype=bool)
+
+
+def last_of_runs(values: np.ndarray) -> np.ndarray:
+    return np.concatenate((values[1:] != values[:-1], [True])) if len(values) > 0 else np.zeros(0, dtype=bool)
+
+
+@span()
 def process_users(users: Iterable[UserRight]) -> list[UserRight]:
-    target_user_rights = {r.value for r in Right}
-    resulting_users = []
-    for user in users:
-        resulting_events = []
-        for event in user.events:
-            added = [Right(right)
-                     for right in event.rights_added
-                     if right in target_user_rights and right not in event.rights_removed]
-            removed = [Right(right)
-                       for right in event.rights_removed
-                       if right in target_user_rights and right not in event.rights_added]
-            event.rights_removed = removed
-            event.rights_added = added
-            if len(added) > 0 or len(removed) > 0:
-                resulting_events.append(event)
-        user.events = resulting_events
-        if len(user.events) > 0:
-            user.events.sort(key=lambda e: e.timestamp)
-            user.earliest_event = user.events[0].timestamp
-            resulting_users.append(user)
-    resulting_users.sort(key=lambda u: u.earliest_event)
-    return resulting_users
+    """
+    Keep net changes of tracked rights and users with at least one of them, ordered by their earliest event.
+    Also derives goodeditor periods and current status of every user.
+    """
+    users = list(users)
+    events = [e for u in users for e in u.events]
+    table = build_event_table(users, events)
+
+    # keep events with a net change, with their rights as Right
+    for u in users:
+        u.events, u.periods = [], []
+    rights = [RIGHTS[r] for r in table.right.tolist()]
+    event_rows = np.flatnonzero(first_of_runs(table.event))
+    # each event's rows are its additions followed by its removals
+    splits = event_rows + np.add.reduceat(table.added, event_rows) if len(event_rows) > 0 else event_rows
+    ends = np.append(event_rows[1:], len(rights))
+    for user, event, start, split, end in zip(table.user[event_rows].tolist(), table.event[event_rows].tolist(),
+                                              event_rows.tolist(), splits.tolist(), ends.tolist()):
+        e = events[event]
+        e.rights_added, e.rights_removed = rights[start:split], rights[split:end]
+        users[user].events.append(e)
+
+    # goodeditor periods: a removal ends the latest period started before it, later removals win
+    good_editor = table.take(table.right == GOOD_EDITOR_ID)
+    starts = good_editor.take(good_editor.added)
+    period_count = np.cumsum(good_editor.added)
+    first_period = np.searchsorted(starts.user, good_editor.user)
+    removals = ~good_editor.added & (period_count > first_period)
+    period = (period_count - 1)[removals][::-1]
+    ended, last_removal = np.unique(period, return_index=True)
+    end_event = np.full(len(starts.event), -1)
+    end_event[ended] = good_editor.event[removals][::-1][last_removal]
+    for user, start, end in zip(starts.user.tolist(), starts.event.tolist(), end_event.tolist()):
+        e = events[start]
+        users[user].periods.append((e.timestamp, events[end].timestamp if end >= 0 else None, e.actor,
+                                    e.reason if e.reason.strip() != "" else "（无理由）"))
+
+    # current status: first right added by the latest event that added any
+    additions = table.take(table.added)
+    first_additions = additions.take(first_of_runs(additions.event))
+    latest = first_additions.take(last_of_runs(first_additions.user))
+    for user, right in zip(latest.user.tolist(), latest.right.tolist()):
+        users[user].current_status = RIGHTS[right]
+
+    # rows are sorted by user and timestamp, so the first row of a user is the earliest event
+    earliest = table.take(first_of_runs(table.user))
+    for user, event in zip(earliest.user.tolist(), earliest.event.tolist()):
+        users[user].earliest_event = events[event].timestamp
+    order = np.lexsort((earliest.user, earliest.timestamp))
+    return [users[user] for user in earliest.user[order].tolist()]
 
 
 def date_to_str(d: datetime) -> str:
@@ -159,28 +274,20 @@ def get_extras(events: list[RightChange]) -> str:
     return res
 
 
+@span()
 def user_to_table_row(user: UserRight) -> str:
-    periods = []
-    current_status = []
-    for e in user.events:
-        if Right.GOOD_EDITOR in e.rights_added:
-            periods.append((e.timestamp, None, e.actor, e.reason if e.reason.strip() != "" else "（无理由）"))
-        if Right.GOOD_EDITOR in e.rights_removed:
-            periods[-1] = (periods[-1][0], e.timestamp, periods[-1][2], periods[-1][3])
-        current_status = e.rights_added if len(e.rights_added) > 0 else current_status
-        if len(e.rights_removed) > 0 and e.rights_removed[0] == current_status:
-            current_status = "user"
-    extras = get_extras(user.events)
+    periods = user.periods
     row_span = len(periods)
     if row_span == 0:
         return ""
+    extras = get_extras(user.events)
     row_span_string = "" if row_span == 1 else "rowspan=" + str(row_span) + "|"
     periods_strings = [(date_to_str(p[0]) + " - " + (date_to_str(p[1]) if p[1] else "") + "||" + p[2],
                         p[3])
                        for p in periods]
     res = "|-\n|" + row_span_string + " -{[[U:" + user.username + "]]}- || " + row_span_string + \
         date_to_str(user.registration_date) + " || " + periods_strings[0][0] + "||" + \
-          row_span_string + Right(current_status[0]).to_chinese() + "||" + periods_strings[0][1] + "||" + \
+          row_span_string + user.current_status.to_chinese() + "||" + periods_strings[0][1] + "||" + \
           row_span_string + extras + "\n"
     if row_span > 1:
         res += "".join("|-\n| " + s[0] + "||" + s[1] + "\n" for s in periods_strings[1:])
@@ -195,4 +302,7 @@ def good_editor_history():
 
 
 if __name__ == "__main__":
-    good_editor_history()
+    # run through the module so that pickled UserRight and RightChange reference good_editor_history.*
+    # rather than __main__, whichever entry point writes the cache
+    import good_editor_history as module
+    module.good_editor_history()
@@ -0,0 +1,220 @@
+"""
+Lightweight instrumentation shared by all scripts.
+
+Set MGP_INSTRUMENT to a file name (or 1 for instrumentation.json) to collect
+  - per-endpoint request counts, errors, bytes and latency histograms for requests and httpx
+  - counters, e.g. retries
+  - cache hits and misses
+  - timed spans around functions decorated with @span or blocks wrapped in timed()
+and write them as JSON when the program exits. Set MGP_PROGRESS=1 for a live progress line on stderr.
+When MGP_INSTRUMENT is not set, @span returns the function unchanged and the other helpers return immediately.
+"""
+import atexit
+import bisect
+import collections
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from urllib.parse import urlsplit
+
+REPORT_FILE = os.environ.get("MGP_INSTRUMENT", "")
+if REPORT_FILE == "1":
+    REPORT_FILE = "instrumentation.json"
+ENABLED = REPORT_FILE != ""
+PROGRESS = ENABLED and os.environ.get("MGP_PROGRESS", "") not in ("", "0")
+
+# upper bounds of histogram buckets in milliseconds, the last bucket is unbounded
+BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+lock = threading.Lock()
+start_time = time.perf_counter()
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        milliseconds = seconds * 1000
+        self.counts[bisect.bisect_left(BUCKETS, milliseconds)] += 1
+        self.count += 1
+        self.total += milliseconds
+        self.max = max(self.max, milliseconds)
+
+    def to_dict(self) -> dict:
+        labels = [f"<={b}ms" for b in BUCKETS] + [f">{BUCKETS[-1]}ms"]
+        return {'count': self.count, 'total_ms': round(self.total, 3), 'max_ms': round(self.max, 3),
+                'mean_ms': round(self.total / self.count, 3) if self.count else 0,
+                'histogram': {label: c for label, c in zip(labels, self.counts) if c > 0}}
+
+
+class Endpoint:
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = 0
+        self.bytes = 0
+
+    def to_dict(self) -> dict:
+        return {'requests': self.latency.count, 'errors': self.errors, 'bytes': self.bytes,
+                'latency': self.latency.to_dict()}
+
+
+endpoints: dict[str, Endpoint] = collections.defaultdict(Endpoint)
+spans: dict[str, Histogram] = collections.defaultdict(Histogram)
+counters: collections.Counter = collections.Counter()
+caches: dict[str, collections.Counter] = collections.defaultdict(collections.Counter)
+
+
+def count(name: str, n: int = 1):
+    if not ENABLED:
+        return
+    with lock:
+        counters[name] += n
+
+
+def cache_hit(name: str, n: int = 1):
+    if not ENABLED:
+        return
+    with lock:
+        caches[name]['hit'] += n
+
+
+def cache_miss(name: str, n: int = 1):
+    if not ENABLED:
+        return
+    with lock:
+        caches[name]['miss'] += n
+
+
+def record_span(name: str, seconds: float):
+    with lock:
+        spans[name].add(seconds)
+
+
+@contextmanager
+def _timed(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_span(name, time.perf_counter() - start)
+
+
+def timed(name: str):
+    """
+    Context manager that records how long its block takes under name.
+    """
+    return _timed(name) if ENABLED else nullcontext()
+
+
+def span(name: str = None):
+    """
+    Decorator that records the duration of every call. Returns the function itself when disabled.
+    """
+    def decorator(func):
+        if not ENABLED:
+            return func
+        span_name = name if name else func.__module__ + "." + func.__qualname__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record_span(span_name, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorator
+
+
+def endpoint_name(url) -> str:
+    parts = urlsplit(str(url))
+    return parts.netloc + parts.path
+
+
+def record_request(url, seconds: float, size: int, error: bool):
+    with lock:
+        endpoint = endpoints[endpoint_name(url)]
+        endpoint.latency.add(seconds)
+        endpoint.bytes += size
+        endpoint.errors += error
+
+
+def install_http_hooks():
+    import requests
+    original_request = requests.Session.request
+
+    def request(self, method, url, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = original_request(self, method, url, *args, **kwargs)
+        except Exception:
+            record_request(url, time.perf_counter() - start, 0, True)
+            raise
+        record_request(url, time.perf_counter() - start, len(response.content), response.status_code >= 400)
+        return response
+
+    requests.Session.request = request
+    try:
+        import httpx
+    except ImportError:
+        return
+    original_async_request = httpx.AsyncClient.request
+
+    async def async_request(self, method, url, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = await original_async_request(self, method, url, *args, **kwargs)
+        except Exception:
+            record_request(url, time.perf_counter() - start, 0, True)
+            raise
+        record_request(url, time.perf_counter() - start, len(response.content), response.status_code >= 400)
+        return response
+
+    httpx.AsyncClient.request = async_request
+
+
+def report() -> dict:
+    with lock:
+        return {
+            'elapsed_s': round(time.perf_counter() - start_time, 3),
+            'requests': {name: e.to_dict() for name, e in endpoints.items()},
+            'counters': dict(counters),
+            'caches': {name: {'hit': c['hit'], 'miss': c['miss'],
+                              'hit_ratio': round(c['hit'] / max(1, c['hit'] + c['miss']), 3)}
+                       for name, c in caches.items()},
+            'spans': {name: h.to_dict() for name, h in spans.items()},
+        }
+
+
+def write_report():
+    with open(REPORT_FILE, "w", encoding="utf-8") as f:
+        json.dump(report(), f, indent=2, ensure_ascii=False)
+
+
+def show_progress():
+    while True:
+        time.sleep(1)
+        with lock:
+            request_count = sum(e.latency.count for e in endpoints.values())
+            byte_count = sum(e.bytes for e in endpoints.values())
+        elapsed = time.perf_counter() - start_time
+        sys.stderr.write(f"\r[{elapsed:.0f}s] {request_count} requests ({request_count / elapsed:.1f}/s), "
+                         f"{byte_count / 2 ** 20:.1f} MB")
+        sys.stderr.flush()
+
+
+if ENABLED:
+    install_http_hooks()
+    atexit.register(write_report)
+    if PROGRESS:
+        threading.Thread(target=show_progress, daemon=True).start()
@@ -0,0 +1,47 @@
+"""
+One entry point for every tool: python mgp_tools.py <command> [arguments of that tool]
+A tool's module, and everything heavy it imports, is only loaded when its command runs.
+"""
+import argparse
+import importlib
+import os
+import sys
+
+# command -> (module, function, description)
+COMMANDS = {
+    "contrib": ("user_contrib", "main", "Plot a user's edits and page creations by namespace."),
+    "contributor-stats": ("contributor_statistics", "main", "Share of bytes added by each user group."),
+    "maintenance": ("contributor_statistics_maintainence", "main", "Edit counts of good editors around maintenance."),
+    "good-editors": ("good_editor_history", "good_editor_history", "Table of good editor tenures."),
+    "producer-template": ("vocaloid_producer_template", "main", "Navbox for vocaloid producers."),
+    "producer-page": ("vocaloid_producer_page", "reprocess", "Refresh Producer_Song templates in data/in.txt."),
+    "vtuber": ("vtuber_songs", "main", "Song lists of bilibili uploaders and BV/av tools."),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="mgp_tools",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="commands:\n" + "\n".join(f"  {name:<20}{description}"
+                                         for name, (_, _, description) in COMMANDS.items()))
+    parser.add_argument("--warm", action="store_true", help="Reuse cookies saved by the previous run.")
+    parser.add_argument("--instrument", metavar="FILE", help="Write an instrumentation report to FILE.")
+    parser.add_argument("--progress", action="store_true", help="Show a live progress line.")
+    parser.add_argument("command", choices=COMMANDS.keys(), metavar="command")
+    parser.add_argument("args", nargs=argparse.REMAINDER, help="Passed on to the command.")
+    args = parser.parse_args()
+    # read by sessions.py and instrumentation.py when they are first imported
+    if args.warm:
+        os.environ["MGP_WARM_START"] = "1"
+    if args.instrument:
+        os.environ["MGP_INSTRUMENT"] = args.instrument
+    if args.progress:
+        os.environ["MGP_PROGRESS"] = "1"
+    module_name, function_name, _ = COMMANDS[args.command]
+    sys.argv = [f"{parser.prog} {args.command}", *args.args]
+    getattr(importlib.import_module(module_name), function_name)()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+requests sessions whose cookies survive between runs.
+With MGP_WARM_START set, a session starts from the cookies saved by the previous run
+instead of visiting warm_up_url again. Cookies are saved when the program exits.
+"""
+import atexit
+import os
+import pickle
+from pathlib import Path
+
+import requests
+
+COOKIE_PATH = Path("cache/cookies")
+WARM_START = os.environ.get("MGP_WARM_START", "") not in ("", "0")
+
+sessions: dict[str, requests.Session] = {}
+
+
+def save_cookies():
+    if len(sessions) == 0:
+        return
+    COOKIE_PATH.mkdir(parents=True, exist_ok=True)
+    for name, session in sessions.items():
+        with open(COOKIE_PATH.joinpath(name + ".pickle"), "wb") as f:
+            pickle.dump(session.cookies, f)
+
+
+def get_session(name: str, warm_up_url: str = None) -> requests.Session:
+    """
+    Get the session called name, creating it on first use.
+    :param name: Name used for the cookie file
+    :param warm_up_url: Visited to obtain cookies when there are no saved ones to reuse
+    """
+    if name in sessions:
+        return sessions[name]
+    session = requests.Session()
+    path = COOKIE_PATH.joinpath(name + ".pickle")
+    if WARM_START and path.exists():
+        with open(path, "rb") as f:
+            session.cookies.update(pickle.load(f))
+    elif warm_up_url is not None:
+        session.get(warm_up_url)
+    if len(sessions) == 0:
+        atexit.register(save_cookies)
+    sessions[name] = session
+    return session
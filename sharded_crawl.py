@@ -0,0 +1,39 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Generator, Iterable
+
+Shard = tuple[datetime, datetime]
+
+
+def make_shards(start: datetime, end: datetime, count: int) -> list[Shard]:
+    """
+    Split [start, end] into disjoint ranges, oldest first.
+    MediaWiki timestamps have a resolution of one second and list bounds are inclusive,
+    so each shard ends one second before the next one starts. Together they cover every second without overlap.
+    :param start: Earliest timestamp
+    :param end: Latest timestamp
+    :param count: Number of shards
+    :return: List of (earliest, latest) pairs
+    """
+    start = start.replace(microsecond=0)
+    end = end.replace(microsecond=0)
+    seconds = int((end - start).total_seconds()) + 1
+    count = max(1, min(count, seconds))
+    bounds = [start + timedelta(seconds=seconds * i // count) for i in range(count + 1)]
+    return [(bounds[i], bounds[i + 1] - timedelta(seconds=1)) for i in range(count)]
+
+
+def crawl_sharded(fetch_shard: Callable[[datetime, datetime], Iterable], shards: list[Shard],
+                  newest_first: bool = True, workers: int = None) -> Generator:
+    """
+    Follow the continuation chain of every shard concurrently and yield the results in timestamp order.
+    :param fetch_shard: (earliest, latest) -> items in that range, in the same order as the whole list
+    :param shards: Disjoint shards, e.g. from make_shards
+    :param newest_first: Whether fetch_shard yields the newest items first
+    :param workers: Number of threads, defaults to one per shard
+    """
+    shards = sorted(shards, reverse=newest_first)
+    with ThreadPoolExecutor(max_workers=workers if workers else len(shards)) as executor:
+        futures = [executor.submit(lambda shard: list(fetch_shard(*shard)), shard) for shard in shards]
+        for future in futures:
+            yield from future.result()
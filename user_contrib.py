@@ -2,13 +2,18 @@ import collections
 import json
 import platform
 import urllib
+from datetime import datetime
 from pathlib import Path
 
-import matplotlib
-import matplotlib.pyplot as plt
 import requests
-from matplotlib.patches import Wedge
-from typing import List, Callable, Any, Generator
+from typing import List, Callable, Any, Generator, Optional, TYPE_CHECKING
+
+import instrumentation
+from instrumentation import span, timed
+from sharded_crawl import make_shards, crawl_sharded
+
+if TYPE_CHECKING:
+    from matplotlib.patches import Wedge
 
 namespace_dict = {
     0: "主", 1: "讨论",
@@ -24,11 +29,40 @@ namespace_dict = {
 }
 
 
-def get_contributions_on_mgp(user: str, create_only: bool) -> list:
+def get_json(url: str) -> dict:
+    # 重试直到成功
+    while True:
+        try:
+            text = requests.get(url).text
+            with timed("json.loads"):
+                return json.loads(text)
+        except Exception as e:
+            instrumentation.count("retries")
+            print(e, ", retrying...")
+
+
+def format_timestamp(d: datetime) -> str:
+    return d.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def get_first_contribution_time(user: str, create_only: bool) -> Optional[datetime]:
     url = "https://mzh.moegirl.org.cn/api.php?action=query" \
           "&list=usercontribs" \
           "&format=json" + ("&ucshow=new" if create_only else "") + \
-          "&ucuser={}&uclimit=500&ucprop=title|tags|flags".format(urllib.parse.quote(user))
+          "&ucuser={}&uclimit=1&ucdir=newer&ucprop=timestamp".format(urllib.parse.quote(user))
+    response = get_json(url)
+    if "query" not in response or len(response['query'].get('usercontribs', [])) == 0:
+        return None
+    return datetime.strptime(response['query']['usercontribs'][0]['timestamp'], "%Y-%m-%dT%H:%M:%SZ")
+
+
+def get_contributions_in_range(user: str, create_only: bool, start: datetime, end: datetime) -> list:
+    # 默认从新到旧获取，所以ucstart是较晚的时间，ucend是较早的时间（两端都包含）
+    url = "https://mzh.moegirl.org.cn/api.php?action=query" \
+          "&list=usercontribs" \
+          "&format=json" + ("&ucshow=new" if create_only else "") + \
+          "&ucuser={}&uclimit=500&ucprop=title|tags|flags".format(urllib.parse.quote(user)) + \
+          "&ucstart={}&ucend={}".format(format_timestamp(end), format_timestamp(start))
     # 一开始不需要uccontinue参数
     cont = ""
     # 用列表（数组）存储所有贡献
@@ -37,15 +71,9 @@ def get_contributions_on_mgp(user: str, create_only: bool) -> list:
     while True:
         # 默认url加上continue参数
         cur = url + cont
-        print("Fetching page", index)
+        print("Fetching page", index, "of", format_timestamp(start), "-", format_timestamp(end))
         index += 1
-        # 重试直到成功
-        while True:
-            try:
-                response = json.loads(requests.get(cur).text)
-                break
-            except Exception as e:
-                print(e, ", retrying...")
+        response = get_json(cur)
         # 请求失败，json数据不包含query
         if "query" not in response or 'usercontribs' not in response['query']:
             print("Something went wrong and no query response was received.")
@@ -60,25 +88,38 @@ def get_contributions_on_mgp(user: str, create_only: bool) -> list:
     return contributions
 
 
+def get_contributions_on_mgp(user: str, create_only: bool, shards: int = 8) -> list:
+    # 把从第一次编辑到现在的时间分成若干段，每段各自翻页，同时获取，最后按时间顺序（从新到旧）拼接
+    first = get_first_contribution_time(user, create_only)
+    if first is None:
+        return []
+    return list(crawl_sharded(lambda start, end: get_contributions_in_range(user, create_only, start, end),
+                              make_shards(first, datetime.utcnow(), shards)))
+
+
 def get_contributions(username: str, create_only: bool = False) -> list:
     path = Path("cache/{}.json".format(username))
     # 缓存机制：将获取的贡献数据在本地存储
     # 如果没有本地数据，从萌百获取并写入文件系统
     if not path.exists():
+        instrumentation.cache_miss("contributions")
         contributions = get_contributions_on_mgp(username, create_only)
         path.touch(exist_ok=True)
         json.dump(contributions, open(path, "w", encoding="utf-8"))
     else:  # 如果有本地数据，直接读取
+        instrumentation.cache_hit("contributions")
         contributions = json.load(open(path, "r", encoding="utf-8"))
         print("Loading data from ", str(path))
     return contributions
 
 
 def plot_pie(t: list, username: str):
+    # matplotlib启动较慢，用到时才导入
+    import matplotlib.pyplot as plt
     # 把名字空间和编辑次数放入两个不同的列表。
     namespaces, edits = zip(*t)
     plt.figure(figsize=[10, 6])
-    patches: List[Wedge]
+    patches: List["Wedge"]
     patches, texts = plt.pie(edits, labels=namespaces)
     plt.legend(patches, [f"{p[0]}: {p[1]}" for p in t], loc='center right',
                bbox_to_anchor=(0, 0.5), fontsize=15)
@@ -88,6 +129,7 @@ def plot_pie(t: list, username: str):
 
 
 def plot_bar(t: list, patches: list, username: str, y_label: str):
+    import matplotlib.pyplot as plt
     plt.figure(figsize=[len(t), 6])
     namespaces, edits = zip(*t)
     bar_plot = plt.bar(x=namespaces, height=edits, color=[p.get_facecolor() for p in patches])
@@ -99,6 +141,7 @@ def plot_bar(t: list, patches: list, username: str, y_label: str):
 
 
 def init_plotting():
+    import matplotlib
     # 部分操作系统中，matplotlib的默认字体不支持中文，因此需要手动指定字体。
     if "Windows" in platform.platform():
         matplotlib.rcParams['font.family'] = "Microsoft YaHei"
@@ -120,6 +163,7 @@ def filter_contributions(contributions: list, predicate: Callable[[Any], bool])
             yield c
 
 
+@span()
 def count_contributions(contributions: list) -> list[tuple[str, int]]:
     # 获取每次编辑的名字空间，并将其转换为文字（如果namespace_dict没有对应的文字，则保留数字）。
     # 最后用Counter统计每个名字空间出现了多少次。
@@ -150,6 +194,7 @@ def process_contributions(username: str):
     print("创建了", len(page_creations), "个页面")
     print("\n".join([f"{p[0]}: {p[1]}" for p in t]))
     plot_contributions(t, username, "创建页面数")
+    import matplotlib.pyplot as plt
     plt.show()
 
 
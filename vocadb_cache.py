@@ -0,0 +1,204 @@
+"""
+Local store of VocaDB songs, albums and artists shared by the producer page and template generators.
+
+Records are keyed by entity id and remember the VocaDB version they were fetched at.
+A sync lists a producer's songs (ids and versions only) and fetches details just for songs
+that are new or whose version changed. Albums and artists are served from the store unless a refresh is asked for.
+To run against a fake server, redirect vocadb.net with benchmark.redirect.
+"""
+import copy
+import os
+import pickle
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List
+
+import requests
+from mgp_common.config import get_cache_path
+from mgp_common.vocadb import Song, get_song_by_id
+
+import instrumentation
+
+VOCADB_URL = "https://vocadb.net"
+PAGE_SIZE = 50
+
+
+class VocadbStore:
+    def __init__(self, path: Path = None, workers: int = 8):
+        """
+        :param path: Pickle file holding the store, defaults to the mgp_common cache folder
+        :param workers: Concurrent detail requests per producer
+        """
+        self.path = path if path is not None else get_cache_path().joinpath("vocadb_store.pickle")
+        self.workers = workers
+        self.lock = threading.Lock()
+        # serializes writes of the pickle file
+        self.save_lock = threading.Lock()
+        # number of open batch() blocks, saving is postponed while positive
+        self.deferred = 0
+        # song id -> (version, load_videos, Song)
+        self.songs: dict[int, tuple[int, bool, Song]] = {}
+        # album id -> (version, name)
+        self.albums: dict[int, tuple[int, str]] = {}
+        # artist id -> {'name', 'version', 'songs': [song ids], 'albums': {query: [album ids]}}
+        self.artists: dict[str, dict] = {}
+        if self.path.exists():
+            with open(self.path, "rb") as f:
+                self.songs, self.albums, self.artists = pickle.load(f)
+
+    def save(self):
+        with self.save_lock:
+            with self.lock:
+                if self.deferred > 0:
+                    return
+                data = pickle.dumps((self.songs, self.albums, self.artists))
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=self.path.parent, prefix=self.path.name, delete=False) as f:
+                f.write(data)
+            os.replace(f.name, self.path)
+
+    @contextmanager
+    def batch(self):
+        """
+        Save once when the block ends instead of after every sync inside it.
+        """
+        with self.lock:
+            self.deferred += 1
+        try:
+            yield self
+        finally:
+            with self.lock:
+                self.deferred -= 1
+            self.save()
+
+    def list_items(self, endpoint: str, params: dict) -> list[dict]:
+        items = []
+        start = 0
+        while True:
+            response = requests.get(VOCADB_URL + endpoint, params={
+                'start': start,
+                'query': "",
+                'maxResults': PAGE_SIZE,
+                **params
+            }).json()
+            items.extend(response['items'])
+            if len(response['items']) < PAGE_SIZE:
+                return items
+            start += PAGE_SIZE
+
+    def is_fresh(self, item: dict, load_videos: bool) -> bool:
+        with self.lock:
+            cached = self.songs.get(item['id'])
+        # songs fetched with videos loaded also serve requests without them
+        return cached is not None and cached[0] == item.get('version') and (cached[1] or not load_videos)
+
+    def sync_producer_songs(self, producer_id: str, load_videos: bool = False):
+        items = self.list_items("/api/songs", {
+            'sort': 'PublishDate',
+            'artistId[]': producer_id,
+            'artistParticipationStatus': 'Everything'
+        })
+        stale = [item for item in items if not self.is_fresh(item, load_videos)]
+        instrumentation.cache_hit("vocadb.songs", len(items) - len(stale))
+        instrumentation.cache_miss("vocadb.songs", len(stale))
+
+        def fetch(item: dict):
+            song = get_song_by_id(str(item['id']), load_videos)
+            with self.lock:
+                self.songs[item['id']] = (item.get('version'), load_videos, song)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            list(executor.map(fetch, stale))
+        with self.lock:
+            artist = self.artists.setdefault(producer_id, {'albums': {}})
+            artist['songs'] = [item['id'] for item in items]
+        self.save()
+
+    def get_producer_songs(self, producer_id: str, load_videos: bool = False, refresh: bool = True) -> List[Song]:
+        """
+        Drop-in replacement for mgp_common.vocadb.get_producer_songs.
+        :param refresh: Sync with VocaDB first. Otherwise only stored songs are returned.
+        """
+        if refresh or 'songs' not in self.artists.get(producer_id, {}):
+            self.sync_producer_songs(producer_id, load_videos)
+        with self.lock:
+            # callers modify songs, so hand out copies
+            return [copy.deepcopy(self.songs[song_id][2]) for song_id in self.artists[producer_id]['songs']]
+
+    def get_producer_albums(self, producer_id: str, only_main: bool = True, only_original: bool = True,
+                            refresh: bool = True) -> List[str]:
+        """
+        Drop-in replacement for mgp_common.vocadb.get_producer_albums.
+        :param refresh: List albums on VocaDB first. Otherwise stored albums are returned when there are any.
+        """
+        query = (only_main, only_original)
+        with self.lock:
+            album_ids = self.artists.get(producer_id, {}).get('albums', {}).get(query)
+        if refresh or album_ids is None:
+            items = self.list_items("/api/albums", {
+                'sort': 'ReleaseDate',
+                'artistId[]': producer_id,
+                'artistParticipationStatus': 'OnlyMainAlbums' if only_main else 'Everything',
+                'discTypes': 'Album' if only_original else 'Unknown'
+            })
+            with self.lock:
+                for item in items:
+                    if self.albums.get(item['id'], (None,))[0] != item.get('version'):
+                        self.albums[item['id']] = (item.get('version'), item['defaultName'])
+                album_ids = [item['id'] for item in items]
+                self.artists.setdefault(producer_id, {'albums': {}})['albums'][query] = album_ids
+            self.save()
+            instrumentation.cache_miss("vocadb.albums")
+        else:
+            instrumentation.cache_hit("vocadb.albums")
+        with self.lock:
+            return [self.albums[album_id][1] for album_id in reversed(album_ids)]
+
+    def get_artist(self, artist_id: str, refresh: bool = False) -> dict:
+        """
+        :param refresh: Check the artist's version on VocaDB even if it is stored
+        """
+        with self.lock:
+            artist = self.artists.get(artist_id, {})
+            if not refresh and 'name' in artist:
+                instrumentation.cache_hit("vocadb.artists")
+                return dict(artist)
+        response = requests.get(f"{VOCADB_URL}/api/artists/{artist_id}").json()
+        with self.lock:
+            artist = self.artists.setdefault(artist_id, {'albums': {}})
+            if artist.get('version') != response.get('version'):
+                instrumentation.cache_miss("vocadb.artists")
+                artist['name'] = response.get('name', response.get('defaultName'))
+                artist['version'] = response.get('version')
+            else:
+                instrumentation.cache_hit("vocadb.artists")
+            artist = dict(artist)
+        self.save()
+        return artist
+
+    def sync_producers(self, producer_ids: List[str], load_videos: bool = False, workers: int = 4):
+        with self.batch(), ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(lambda producer_id: self.sync_producer_songs(producer_id, load_videos), producer_ids))
+
+
+store: VocadbStore = None
+store_lock = threading.Lock()
+
+
+def get_store() -> VocadbStore:
+    global store
+    with store_lock:
+        if store is None:
+            store = VocadbStore()
+        return store
+
+
+def get_producer_songs(producer_id: str, load_videos: bool = False) -> List[Song]:
+    return get_store().get_producer_songs(producer_id, load_videos)
+
+
+def get_producer_albums(producer_id: str, only_main: bool = True, only_original: bool = True) -> List[str]:
+    return get_store().get_producer_albums(producer_id, only_main, only_original)
@@ -2,10 +2,14 @@ from datetime import datetime
 
 from mgp_common.string_utils import auto_lj, is_empty
 from mgp_common.video import VideoSite, get_nc_info, video_from_site, get_bb_info
-from mgp_common.vocadb import get_producer_songs, Song
+from mgp_common.vocadb import Song
 import wikitextparser as wtp
 
+from instrumentation import span
+from vocadb_cache import get_producer_songs, get_store
 
+
+@span()
 def song_to_str(song: Song):
     t = wtp.Template("{{Producer_Song}}")
     mapping = {
@@ -47,6 +51,8 @@ def song_to_str(song: Song):
 
 
 def create_song_list(producer_id: str, producer_name: str = ""):
+    if producer_name == "":
+        producer_name = get_store().get_artist(producer_id)['name']
     songs = get_producer_songs(producer_id, load_videos=True)
     songs = [s for s in songs if len(s.videos) > 0]
     for s in songs:
@@ -80,5 +86,6 @@ def reprocess():
         print(str(t) + "\n")
 
 
-# create_song_list("904", "はりーP")
-reprocess()
+if __name__ == "__main__":
+    # create_song_list("904", "はりーP")
+    reprocess()
@@ -1,15 +1,26 @@
+import argparse
+import bisect
+import os
 import platform
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from enum import Enum
+from pathlib import Path
 from textwrap import indent
-from threading import Thread
+from threading import Thread, Condition
 from typing import List
 
-import requests
 from mgp_common.config import get_cache_path
 from mgp_common.string_utils import auto_lj
 from mgp_common.video import VideoSite
-from mgp_common.vocadb import get_producer_songs, get_producer_albums, Song
+from mgp_common.vocadb import Song
 from requests import Session
 
+from instrumentation import span
+from sessions import get_session
+from vocadb_cache import get_producer_songs, get_producer_albums, get_store
+
 BOLD_START = '\033[1m'
 BOLD_END = '\033[0m'
 
@@ -29,19 +40,36 @@ def song_to_link(s: Song) -> str:
     return trans + "{{!}}" + auto_lj(name_ja)
 
 
-def get_original_songs_template(songs: List[Song]):
-    year_to_songs = dict()
-    for index, s in enumerate(songs):
-        prev = year_to_songs.get(s.publish_date.year, [])
-        prev.append(s)
-        year_to_songs[s.publish_date.year] = prev
-    year_strings = []
-    for index, year in enumerate(sorted(year_to_songs.keys())):
-        song_list = sorted(year_to_songs[year], key=lambda song: song.publish_date)
-        s = f"|group{index + 1} = " + str(year) + "年\n" + \
+class OriginalSongsTemplate:
+    """
+    Songs grouped by year, each group kept sorted by publish date.
+    Every year block is rendered once and only re-rendered when one of its songs changes.
+    """
+
+    def __init__(self, songs: List[Song]):
+        self.year_to_songs: dict[int, List[Song]] = dict()
+        for s in songs:
+            song_list = self.year_to_songs.setdefault(s.publish_date.year, [])
+            bisect.insort(song_list, s, key=lambda song: song.publish_date)
+        self.years = sorted(self.year_to_songs.keys())
+        self.year_strings = {year: self.render_year(index, year) for index, year in enumerate(self.years)}
+
+    def render_year(self, index: int, year: int) -> str:
+        song_list = self.year_to_songs[year]
+        return f"|group{index + 1} = " + str(year) + "年\n" + \
             f"|list{index + 1} = " + "{{links|" + "|".join(song_to_link(s) for s in song_list) + "}}"
-        year_strings.append(s)
-    return "\n".join(year_strings)
+
+    @span()
+    def update(self, s: Song):
+        year = s.publish_date.year
+        self.year_strings[year] = self.render_year(self.years.index(year), year)
+
+    def __str__(self):
+        return "\n".join(self.year_strings[year] for year in self.years)
+
+
+def get_original_songs_template(songs: List[Song]):
+    return str(OriginalSongsTemplate(songs))
 
 
 def get_album_template(producer_id: str) -> str:
@@ -69,18 +97,22 @@ def search_bb_keyword(session: Session, keyword: str):
         return []
 
 
+@span()
 def search_bb_for_titles(session: Session, s: Song) -> List[str]:
     result = []
     for v in s.videos:
         if v.site == VideoSite.NICO_NICO:
             result.extend(search_bb_keyword(session, v.url[v.url.rfind('/') + 1:]))
     result.extend(search_bb_keyword(session, s.name_ja))
-    return [t.replace('<em class="keyword">', BOLD_START)
-                .replace('</em>', BOLD_END)
-                .replace('&quot;', '"')
-                .replace('&amp;', '&')
-                .replace('&#39;', "'")
-            for t in set(result)]
+    return [clean_search_title(t) for t in set(result)]
+
+
+def clean_search_title(title: str, bold_start: str = BOLD_START, bold_end: str = BOLD_END) -> str:
+    return title.replace('<em class="keyword">', bold_start) \
+        .replace('</em>', bold_end) \
+        .replace('&quot;', '"') \
+        .replace('&amp;', '&') \
+        .replace('&#39;', "'")
 
 
 class SearchThread(Thread):
@@ -94,64 +126,197 @@ class SearchThread(Thread):
         self.result = search_bb_for_titles(self.session, self.s)
 
 
-def make_template(producer_id: str):
+def write_atomic(path: Path, content: str):
+    # unique temporary name, concurrent writers of the same path must not rename each other's files
+    with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=path.parent, prefix=path.name,
+                                     delete=False) as f:
+        f.write(content)
+    os.replace(f.name, path)
+
+
+class WriteBehindThread(Thread):
+    """
+    Writes the latest submitted content to path in the background.
+    Submissions that arrive while a write is in progress are coalesced into one write.
+    """
+
+    def __init__(self, path: Path):
+        super().__init__(daemon=True)
+        self.path = path
+        self.content = None
+        self.closed = False
+        self.condition = Condition()
+
+    def submit(self, content: str):
+        with self.condition:
+            self.content = content
+            self.condition.notify()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+        self.join()
+
+    def run(self) -> None:
+        while True:
+            with self.condition:
+                while self.content is None and not self.closed:
+                    self.condition.wait()
+                content, self.content = self.content, None
+            if content is None:
+                return
+            write_atomic(self.path, content)
+
+
+@span()
+def make_navbox(original_songs: OriginalSongsTemplate, album_template: str) -> str:
+    return "{{Navbox\n|name =\n|title =\n" + \
+           "|state = {{#ifeq:{{{1}}}|collapsed|mw-collapsible mw-collapsed|mw-uncollapsed}}\n" + \
+           "|titlestyle =\n|groupstyle =\n|liststyle =\n" + \
+           "|group1 = 原创投稿曲目\n" + \
+           "|list1 = {{Navbox_subgroup\n" + indent(str(original_songs) + "}}", prefix="  ") + "\n" + \
+           album_template + \
+           "}}"
+
+
+def get_producer_original_songs(producer_id: str) -> List[Song]:
     songs = get_producer_songs(producer_id)
     songs = [s for s in songs if len(s.videos) > 0 and s.original]
-    songs = sorted(songs, key=lambda s: s.publish_date)
+    return sorted(songs, key=lambda s: s.publish_date)
+
+
+def make_template(producer_id: str) -> str:
+    songs = get_producer_original_songs(producer_id)
     album_template = get_album_template(producer_id)
+    original_songs = OriginalSongsTemplate(songs)
 
-    def make_string():
-        original_songs = get_original_songs_template(songs)
-        return "{{Navbox\n|name =\n|title =\n" + \
-               "|state = {{#ifeq:{{{1}}}|collapsed|mw-collapsible mw-collapsed|mw-uncollapsed}}\n" + \
-               "|titlestyle =\n|groupstyle =\n|liststyle =\n" + \
-               "|group1 = 原创投稿曲目\n" + \
-               "|list1 = {{Navbox_subgroup\n" + indent(original_songs + "}}", prefix="  ") + "\n" + \
-               album_template + \
-               "}}"
-
-    p = get_cache_path().joinpath("vocaloid_producer_template.txt")
-    session = requests.Session()
-    # get cookies, see bilibili-API-collect for more information
-    session.get("https://bilibili.com")
-    search_task = SearchThread(session, songs[0])
-    search_task.start()
-    for index, s in enumerate(songs):
-        with open(p, "w", encoding="utf-8") as f:
-            f.write(make_string())
-        search_task.join()
-        titles = search_task.result
-        # start loading the info the for next song
-        if index < len(songs) - 1:
-            search_task = SearchThread(session, songs[index + 1])
-            search_task.start()
-        print("====== " + s.name_ja + " ======")
-        print("\n".join(titles))
-        options = ["Keep original.", *s.name_other,
-                   "Enter your translation (input directly, don't use the number)."]
-        print("\n".join(f"{index + 1}. {text}" for index, text in enumerate(options)))
-        while True:
-            response = input()
-            if response.strip() == "":
-                s.name_chs = s.name_ja
+    writer = WriteBehindThread(get_cache_path().joinpath("vocaloid_producer_template.txt"))
+    writer.start()
+    writer.submit(make_navbox(original_songs, album_template))
+    # close even when interrupted, so that the last submitted navbox is written
+    try:
+        # get cookies, see bilibili-API-collect for more information
+        session = get_session("bilibili", "https://bilibili.com")
+        search_task = SearchThread(session, songs[0])
+        search_task.start()
+        for index, s in enumerate(songs):
+            search_task.join()
+            titles = search_task.result
+            # start loading the info the for next song
+            if index < len(songs) - 1:
+                search_task = SearchThread(session, songs[index + 1])
+                search_task.start()
+            print("====== " + s.name_ja + " ======")
+            print("\n".join(titles))
+            options = ["Keep original.", *s.name_other,
+                       "Enter your translation (input directly, don't use the number)."]
+            print("\n".join(f"{index + 1}. {text}" for index, text in enumerate(options)))
+            while True:
+                response = input()
+                if response.strip() == "":
+                    s.name_chs = s.name_ja
+                    break
+                try:
+                    int_option = int(response)
+                    if int_option == 1:
+                        s.name_chs = s.name_ja
+                    elif 1 < int_option < len(options):
+                        s.name_chs = options[int_option - 1]
+                    else:
+                        print("Invalid option number. Redo...")
+                        continue
+                except ValueError:
+                    s.name_chs = response.strip()
                 break
+            original_songs.update(s)
+            writer.submit(make_navbox(original_songs, album_template))
+    finally:
+        writer.close()
+    return make_navbox(original_songs, album_template)
+
+
+class TranslationPolicy(Enum):
+    KEEP_ORIGINAL = "keep_original"
+    FIRST_OTHER = "first_other"
+    SEARCH = "search"
+
+    def __str__(self):
+        return self.value
+
+
+def auto_translate(session: Session, s: Song, policy: TranslationPolicy):
+    """
+    Choose a translation without asking. Songs without a candidate keep their original title.
+    :param session: Session used for bilibili searches
+    :param s: Song to translate
+    :param policy: keep the original title, first name_other or top bilibili search hit
+    """
+    if policy == TranslationPolicy.FIRST_OTHER and len(s.name_other) > 0:
+        s.name_chs = s.name_other[0]
+    elif policy == TranslationPolicy.SEARCH:
+        titles = search_bb_keyword(session, s.name_ja)
+        if len(titles) > 0:
+            s.name_chs = clean_search_title(titles[0], "", "")
+
+
+def make_template_headless(session: Session, producer_id: str, policy: TranslationPolicy) -> int:
+    songs = get_producer_original_songs(producer_id)
+    album_template = get_album_template(producer_id)
+    for s in songs:
+        auto_translate(session, s, policy)
+    navbox = make_navbox(OriginalSongsTemplate(songs), album_template)
+    write_atomic(get_cache_path().joinpath(f"vocaloid_producer_template_{producer_id}.txt"), navbox)
+    return len(songs)
+
+
+def make_templates_batch(producer_ids: List[str], policy: TranslationPolicy, workers: int = 8):
+    # get cookies, see bilibili-API-collect for more information
+    session = get_session("bilibili", "https://bilibili.com" if policy == TranslationPolicy.SEARCH else None)
+
+    def timed(producer_id: str) -> tuple[int, float]:
+        start = time.perf_counter()
+        song_count = make_template_headless(session, producer_id, policy)
+        return song_count, time.perf_counter() - start
+
+    # every producer writes its own file, so each id is processed once
+    producer_ids = list(dict.fromkeys(producer_ids))
+    start = time.perf_counter()
+    total_songs = 0
+    failed = []
+    # the VocaDB store is saved once after all producers
+    with get_store().batch(), ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(timed, producer_id): producer_id for producer_id in producer_ids}
+        for future in as_completed(futures):
+            producer_id = futures[future]
             try:
-                int_option = int(response)
-                if int_option == 1:
-                    s.name_chs = s.name_ja
-                elif 1 < int_option < len(options):
-                    s.name_chs = options[int_option - 1]
-                else:
-                    print("Invalid option number. Redo...")
-                    continue
-            except ValueError:
-                s.name_chs = response.strip()
-            break
+                song_count, elapsed = future.result()
+            except Exception as e:
+                print(f"{producer_id}: failed ({e})")
+                failed.append(producer_id)
+                continue
+            total_songs += song_count
+            print(f"{producer_id}: {song_count} songs in {elapsed:.1f}s")
+    elapsed = time.perf_counter() - start
+    succeeded = len(producer_ids) - len(failed)
+    print(f"{succeeded} producers, {total_songs} songs in {elapsed:.1f}s "
+          f"({succeeded / elapsed * 60:.1f} producers/min, {total_songs / elapsed:.1f} songs/s)")
+    if len(failed) > 0:
+        print(f"{len(failed)} failed: " + ", ".join(failed))
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Generate navboxes for vocaloid producers.")
+    parser.add_argument("ids", nargs="*", help="Vocadb ids. Runs without prompts if given.")
+    parser.add_argument("--policy", type=TranslationPolicy, choices=list(TranslationPolicy),
+                        default=TranslationPolicy.KEEP_ORIGINAL, help="How to pick translations in batch mode.")
+    parser.add_argument("--workers", type=int, default=8, help="Producers processed concurrently.")
+    args = parser.parse_args()
     p = get_cache_path()
     p.mkdir(exist_ok=True)
+    if len(args.ids) > 0:
+        make_templates_batch(args.ids, args.policy, args.workers)
+        return
     target = input("Vocadb id?\n").strip()
     print(make_template(target))
 
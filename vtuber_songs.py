@@ -1,43 +1,126 @@
+import argparse
+import asyncio
 import collections
+import itertools
+import json
+import mmap
+import os
+import random
 import re
+import sys
+import time
+import urllib.parse
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from dataclasses import dataclass
 from datetime import datetime, timezone, timedelta
-from typing import Generator, Iterable
+from pathlib import Path
+from typing import Callable, Coroutine, Generator, Iterable, Optional, TYPE_CHECKING
 
-import bilibili_api.video
-from bilibili_api import sync
-from bilibili_api.user import ChannelSeries, ChannelSeriesType, User
+import wikitextparser as wtp
 
+import instrumentation
+from instrumentation import span
+
+if TYPE_CHECKING:
+    from bilibili_api.user import ChannelSeries
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 # from https://github.com/ShiSheng233/bili_BV/blob/master/biliBV/__init__.py
+BV_TABLE = 'fZodR9XQDSUm21yCkr6zBqiveYah8bt4xsWpHnJE7jL5VG3guMTKNPAwcF'
+BV_TABLE_INDEX = {c: i for i, c in enumerate(BV_TABLE)}
+BV_POSITIONS = [11, 10, 3, 8, 4, 6]
+BV_POWERS = [58 ** i for i in range(6)]
+BV_XOR = 177451812
+BV_ADD = 8728348608
+BV_TEMPLATE = 'BV1  4 1 7  '
+# largest av whose BV fits in the six digits
+MAX_AV = 29511122943
+AV_TOKEN_PATTERN = re.compile(r"(?:av)?([0-9]+)", re.IGNORECASE)
+
+if np is not None:
+    BV_TABLE_ARRAY = np.array(list(BV_TABLE))
+    BV_POWERS_ARRAY = np.array(BV_POWERS, dtype=np.int64)
+    BV_TEMPLATE_ARRAY = np.array(list(BV_TEMPLATE))
+    # code point -> table index; -1 marks characters that cannot appear in a BV
+    BV_LOOKUP_ARRAY = np.full(128, -1, dtype=np.int64)
+    BV_LOOKUP_ARRAY[[ord(c) for c in BV_TABLE]] = np.arange(58)
+
+
 def av_to_bv(av):
-    key = 'fZodR9XQDSUm21yCkr6zBqiveYah8bt4xsWpHnJE7jL5VG3guMTKNPAwcF'
-    dic = {}
-    for num in range(58):
-        dic[key[num]] = num
-    s = [11, 10, 3, 8, 4, 6]
-    xor = 177451812
-    add = 8728348608
-    av = (int(str(av).lstrip('av')) ^ xor) + add
-    r = list('BV1  4 1 7  ')
+    av = (int(str(av).lstrip('av')) ^ BV_XOR) + BV_ADD
+    r = list(BV_TEMPLATE)
     for a in range(6):
-        r[s[a]] = key[av // 58 ** a % 58]
+        r[BV_POSITIONS[a]] = BV_TABLE[av // BV_POWERS[a] % 58]
     return ''.join(r)
 
 
 def bv_to_av(BV):
-    key = 'fZodR9XQDSUm21yCkr6zBqiveYah8bt4xsWpHnJE7jL5VG3guMTKNPAwcF'
-    dic = {}
-    for num in range(58):
-        dic[key[num]] = num
-    s = [11, 10, 3, 8, 4, 6]
-    xor = 177451812
-    add = 8728348608
     r = 0
     for a in range(6):
-        r += dic[BV[s[a]]] * 58 ** a
-    return (r - add) ^ xor
+        r += BV_TABLE_INDEX[BV[BV_POSITIONS[a]]] * BV_POWERS[a]
+    return (r - BV_ADD) ^ BV_XOR
+
+
+def parse_av(token: str) -> Optional[int]:
+    """
+    :return: The av number of tokens like av170001 or 170001, None if there is no such video id
+    """
+    match = AV_TOKEN_PATTERN.fullmatch(token)
+    if match is None:
+        return None
+    av = int(match.group(1))
+    return av if is_valid_av(av) else None
+
+
+def is_valid_av(av: int) -> bool:
+    # near MAX_AV, some numbers don't fit into the six digits after the xor
+    return 1 <= av <= MAX_AV and (av ^ BV_XOR) + BV_ADD < 58 ** 6
+
+
+def is_bv(token: str) -> bool:
+    return len(token) == len(BV_TEMPLATE) \
+        and all(c == " " or token[i] == c for i, c in enumerate(BV_TEMPLATE)) \
+        and all(token[i] in BV_TABLE_INDEX for i in BV_POSITIONS)
+
+
+def av_to_bv_batch(avs: Iterable) -> list[str]:
+    """
+    Convert many av ids at once. Accepts the same inputs as av_to_bv, or an integer numpy array.
+    """
+    if np is not None and isinstance(avs, np.ndarray):
+        avs = avs.astype(np.int64)
+    else:
+        avs = [int(str(av).lstrip('av')) for av in avs]
+    if np is None:
+        return [av_to_bv(av) for av in avs]
+    x = (np.asarray(avs, dtype=np.int64) ^ BV_XOR) + BV_ADD
+    r = np.tile(BV_TEMPLATE_ARRAY, (len(x), 1))
+    r[:, BV_POSITIONS] = BV_TABLE_ARRAY[x[:, None] // BV_POWERS_ARRAY % 58]
+    return r.view(f'<U{len(BV_TEMPLATE)}').ravel().tolist()
+
+
+def bv_to_av_batch(bvs: Iterable[str]) -> list[int]:
+    """
+    Convert many BV ids at once.
+    """
+    if np is None:
+        return [bv_to_av(bv) for bv in bvs]
+    codes = np.asarray(list(bvs), dtype=f'<U{len(BV_TEMPLATE)}').view(np.uint32).reshape(-1, len(BV_TEMPLATE))
+    digits = BV_LOOKUP_ARRAY[np.minimum(codes[:, BV_POSITIONS], 127)]
+    if (digits < 0).any():
+        raise KeyError("Invalid character in BV id")
+    return ((digits @ BV_POWERS_ARRAY - BV_ADD) ^ BV_XOR).tolist()
+
+
+def sync(coroutine: Coroutine):
+    # bilibili_api is slow to import, so only load it once something is fetched
+    from bilibili_api import sync as bilibili_sync
+    return bilibili_sync(coroutine)
 
 
 @dataclass
@@ -52,48 +135,275 @@ def timestamp_to_date(ts: int) -> str:
     return datetime.fromtimestamp(ts, tz=timezone(offset=timedelta(hours=8))).strftime("%y/%m/%d")
 
 
-def get_videos_in_channel(s: ChannelSeries) -> list[Video]:
-    videos = []
+PAGE_CONCURRENCY = 4
+LISTING_CACHE_PATH = Path("data/listings")
+
+
+def fetch_pages(fetch_page: Callable[[int], Coroutine], parse_page: Callable[[dict], tuple[list, int]],
+                page_size: int, first_page: tuple[list, int] = None) -> Generator:
+    """
+    Yield the items of every page in page order.
+    The first response reveals the total count; the remaining pages are then fetched concurrently on one loop.
+    :param fetch_page: Page number to coroutine returning the response
+    :param parse_page: Response to (items, total item count)
+    :param page_size: Page size used by fetch_page
+    :param first_page: Already parsed first page, if any
+    """
+    items, total = parse_page(sync(fetch_page(1))) if first_page is None else first_page
+    yield from items
+    page_count = (total + page_size - 1) // page_size
+    if page_count <= 1:
+        return
+    loop = asyncio.get_event_loop()
+    semaphore = asyncio.Semaphore(PAGE_CONCURRENCY)
+
+    async def fetch(pn: int) -> list:
+        async with semaphore:
+            return parse_page(await fetch_page(pn))[0]
+
+    tasks = [loop.create_task(fetch(pn)) for pn in range(2, page_count + 1)]
+    try:
+        for task in tasks:
+            yield from loop.run_until_complete(task)
+    finally:
+        for task in tasks:
+            task.cancel()
+        loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+
+
+def fetch_pages_until(fetch_page: Callable[[int], Coroutine], parse_page: Callable[[dict], tuple[list, int]],
+                      page_size: int, stop: Callable[[dict], bool]) -> Generator:
+    """
+    Yield items page by page until stop returns True for an item.
+    """
     page = 1
-    page_size = 100
     while True:
-        v = sync(s.get_videos(pn=page, ps=page_size))['archives']
-        videos.extend(v)
-        if len(v) < page_size:
-            break
+        items, _ = parse_page(sync(fetch_page(page)))
+        for v in items:
+            if stop(v):
+                return
+            yield v
+        if len(items) < page_size:
+            return
         page += 1
+
+
+def get_listing(key: str, fetch_page: Callable[[int], Coroutine], parse_page: Callable[[dict], tuple[list, int]],
+                page_size: int, newest_first: bool) -> Generator:
+    """
+    Like fetch_pages, but remembers the listing in LISTING_CACHE_PATH.
+    On reruns, newest first listings only fetch pages until a known video shows up.
+    Other listings are reused as long as their total and first page are unchanged.
+    """
+    path = LISTING_CACHE_PATH.joinpath(key + ".json")
+    cached = None
+    if path.exists():
+        with open(path, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+    listing = []
+    if cached is None:
+        instrumentation.cache_miss("listing")
+        for v in fetch_pages(fetch_page, parse_page, page_size):
+            listing.append(v)
+            yield v
+    else:
+        instrumentation.cache_hit("listing")
+        first_page = parse_page(sync(fetch_page(1)))
+        items, total = first_page
+        if newest_first:
+            known = set(v['bvid'] for v in cached)
+            page = 1
+            while True:
+                new_items = list(itertools.takewhile(lambda v: v['bvid'] not in known, items))
+                listing.extend(new_items)
+                yield from new_items
+                if len(new_items) < len(items) or len(items) < page_size:
+                    break
+                page += 1
+                items, _ = parse_page(sync(fetch_page(page)))
+            listing.extend(cached)
+            yield from cached
+        elif total == len(cached) and [v['bvid'] for v in items] == [v['bvid'] for v in cached[:len(items)]]:
+            listing = cached
+            yield from cached
+        else:
+            for v in fetch_pages(fetch_page, parse_page, page_size, first_page):
+                listing.append(v)
+                yield v
+    LISTING_CACHE_PATH.mkdir(parents=True, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(listing, f, ensure_ascii=False)
+
+
+def get_videos_in_channel(s: "ChannelSeries", use_cache: bool = True) -> list[Video]:
+    page_size = 100
+
+    def fetch_page(pn: int) -> Coroutine:
+        return s.get_videos(pn=pn, ps=page_size)
+
+    def parse_page(response: dict) -> tuple[list, int]:
+        return response['archives'], response['page']['total']
+
+    if use_cache:
+        # season and series ids are separate id spaces
+        channel_type = "season" if s.is_new else "series"
+        videos = get_listing(f"channel_{s.uid}_{channel_type}_{s.id_}", fetch_page, parse_page, page_size,
+                             newest_first=False)
+    else:
+        videos = fetch_pages(fetch_page, parse_page, page_size)
     return [parse_video(v) for v in videos]
 
 
-def has_tags(bv: str, tags: list[str]) -> bool:
-    video_tags = [tag['tag_name'] for tag in sync(bilibili_api.video.Video(bvid=bv).get_tags())]
-    return any(tag in video_tags for tag in tags)
+TAG_CACHE_FILE = Path("data/video_tags.json")
 
 
-def filter_videos(videos: Iterable[Video], keywords: list[str] = None, exclude: list[str] = None,
-                  tags: list[str] = None) -> Generator:
-    for v in videos:
-        if (keywords is None or any(keyword in v.title for keyword in keywords)) and \
-                (exclude is None or all(e not in v.title for e in exclude)) and \
-                (tags is None or has_tags(v.bv, tags)):
-            yield v
+def load_tag_cache() -> dict[str, list[str]]:
+    if not TAG_CACHE_FILE.exists():
+        return {}
+    with open(TAG_CACHE_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_tag_cache(cache: dict[str, list[str]]) -> None:
+    TAG_CACHE_FILE.parent.mkdir(exist_ok=True)
+    with open(TAG_CACHE_FILE, "w", encoding="utf-8") as f:
+        json.dump(cache, f, ensure_ascii=False)
+
+
+async def fetch_tags(bvs: Iterable[str], cache: dict[str, list[str]], concurrency: int = 8) -> None:
+    """
+    Fetch tags of every video not in cache yet, at most concurrency requests at a time.
+    """
+    import bilibili_api.video
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(bv: str):
+        async with semaphore:
+            cache[bv] = [tag['tag_name'] for tag in await bilibili_api.video.Video(bvid=bv).get_tags()]
+
+    bvs = set(bvs)
+    missing = [bv for bv in bvs if bv not in cache]
+    instrumentation.cache_hit("tags", len(bvs) - len(missing))
+    instrumentation.cache_miss("tags", len(missing))
+    await asyncio.gather(*(fetch(bv) for bv in missing))
 
 
-def write_videos_to_file(videos) -> None:
-    videos = list(videos)
+def has_tags(bv: str, tags: list[str], cache: dict[str, list[str]] = None) -> bool:
+    if cache is None:
+        cache = {}
+    if bv not in cache:
+        sync(fetch_tags([bv], cache))
+    return any(tag in cache[bv] for tag in tags)
+
+
+def filter_videos(videos: Iterable[Video], keywords: list[str] = None, exclude: list[str] = None,
+                  tags: list[str] = None, batch_size: int = 50) -> Generator:
+    candidates = (v for v in videos
+                  if (keywords is None or any(keyword in v.title for keyword in keywords)) and
+                  (exclude is None or all(e not in v.title for e in exclude)))
+    if tags is None:
+        yield from candidates
+        return
+    cache = load_tag_cache()
+    while batch := list(itertools.islice(candidates, batch_size)):
+        # resolve tags for the whole batch concurrently, then yield in the original order
+        sync(fetch_tags((v.bv for v in batch), cache))
+        save_tag_cache(cache)
+        for v in batch:
+            if has_tags(v.bv, tags, cache):
+                yield v
+
+
+VIDEO_FILE = Path("data/vtuber_songs.txt")
+CST = timezone(offset=timedelta(hours=8))
+
+
+@span()
+def video_to_str(v: Video) -> str:
+    return ("{{Temple Song\n"
+            "|color = transparent\n"
+            "|bb_id = " + v.bv + "\n" +
+            "|曲目 = " + v.title + "\n" +
+            "|投稿日期 = " + timestamp_to_date(v.pubdate) + "\n" +
+            "|再生数量 = " + "{{BilibiliCount|id=" + v.bv + "}}\n" +
+            "|image link = " + v.image_link + " }}"
+            )
+
+
+def parse_video_file(text: str) -> dict[str, tuple[tuple[int, int], Optional[datetime]]]:
+    """
+    Index the {{Temple Song}} blocks of an existing output file.
+    :return: bv -> (span of the block in text, upload date or None if the date was edited into another format)
+    """
+    index = {}
+    for t in wtp.parse(text).templates:
+        if t.name.strip() != "Temple Song" or t.get_arg("bb_id") is None or t.get_arg("投稿日期") is None:
+            continue
+        try:
+            date = datetime.strptime(t.get_arg("投稿日期").value.strip(), "%y/%m/%d").replace(tzinfo=CST)
+        except ValueError:
+            date = None
+        index[t.get_arg("bb_id").value.strip()] = (t.span, date)
+    return index
+
+
+@span()
+def merge_videos_into_text(text: str, videos: Iterable[Video]) -> str:
+    """
+    Insert blocks for videos not in text yet, each before the first existing block with a later date,
+    or after the last block. Existing blocks and text around them are left as they are.
+    """
+    index = parse_video_file(text)
+    # blocks without a readable date are not used as anchors
+    blocks = sorted(((block_span, d) for block_span, d in index.values() if d is not None),
+                    key=lambda block: block[0][0])
+    end = max((block_span[1] for block_span, _ in index.values()), default=len(text))
+    insertions: dict[int, list[str]] = {}
+    for v in sorted(videos, key=lambda vid: vid.pubdate):
+        if v.bv in index:
+            continue
+        date = datetime.strptime(timestamp_to_date(v.pubdate), "%y/%m/%d").replace(tzinfo=CST)
+        later = next((block_span for block_span, d in blocks if d > date), None)
+        position = later[0] if later is not None else end
+        insertions.setdefault(position, []).append(video_to_str(v))
     result = []
-    videos = sorted(videos, key=lambda vid: vid.pubdate)
-    for index, v in enumerate(videos):
-        s = ("{{Temple Song\n"
-             "|color = transparent\n"
-             "|bb_id = " + v.bv + "\n" +
-             "|曲目 = " + v.title + "\n" +
-             "|投稿日期 = " + timestamp_to_date(v.pubdate) + "\n" +
-             "|再生数量 = " + "{{BilibiliCount|id=" + v.bv + "}}\n" +
-             "|image link = " + v.image_link + " }}"
-             )
-        result.append(s)
-    open("data/vtuber_songs.txt", "w").write("\n\n".join(result))
+    prev = 0
+    for position in sorted(insertions.keys()):
+        result.append(text[prev:position])
+        new_blocks = "\n\n".join(insertions[position])
+        if position == end:
+            result.append(("\n\n" if text[:position].strip() != "" else "") + new_blocks)
+        else:
+            result.append(new_blocks + "\n\n")
+        prev = position
+    result.append(text[prev:])
+    return "".join(result)
+
+
+def write_videos_to_file(videos, merge: bool = False, filename: Path = VIDEO_FILE) -> None:
+    if merge and filename.exists():
+        text = merge_videos_into_text(open(filename, "r", encoding="utf-8").read(), videos)
+    else:
+        videos = sorted(videos, key=lambda vid: vid.pubdate)
+        text = "\n\n".join(video_to_str(v) for v in videos)
+    filename.parent.mkdir(exist_ok=True)
+    open(filename, "w", encoding="utf-8").write(text)
+
+
+def refresh_video_file(uid: int, search: str = "", tid: int = 0, filename: Path = VIDEO_FILE) -> None:
+    """
+    Add the uploader's videos that are newer than the newest video in filename.
+    """
+    if not filename.exists():
+        write_videos_to_file(get_user_videos(uid, search, tid), filename=filename)
+        return
+    index = parse_video_file(open(filename, "r", encoding="utf-8").read())
+    # the file only records dates, so fetch everything since the start of the newest day
+    since = int(max((date for _, date in index.values() if date is not None),
+                    default=datetime.fromtimestamp(0, CST)).timestamp())
+    videos = [v for v in get_user_videos(uid, search, tid, since=since) if v.bv not in index]
+    print(len(videos), "new videos")
+    write_videos_to_file(videos, merge=True, filename=filename)
 
 
 def parse_video(source) -> Video:
@@ -105,17 +415,30 @@ def parse_video(source) -> Video:
     return Video(source['bvid'], source['title'], pubdate, source['pic'])
 
 
-def get_user_videos(uid: int, search: str = "", tid: int = 0) -> Generator:
-    page = 1
-    page_size = 30
+def get_user_videos(uid: int, search: str = "", tid: int = 0, use_cache: bool = True, since: int = None) -> Generator:
+    """
+    :param since: If given, only fetch videos published at or after this timestamp, page by page.
+    """
+    # largest page size accepted by the endpoint
+    page_size = 50
+    from bilibili_api.user import User
     user = User(uid=uid)
-    while True:
-        videos = sync(user.get_videos(pn=page, tid=tid, ps=page_size, keyword=search))['list']['vlist']
-        for v in videos:
-            yield parse_video(v)
-        if len(videos) < page_size:
-            break
-        page += 1
+
+    def fetch_page(pn: int) -> Coroutine:
+        return user.get_videos(pn=pn, tid=tid, ps=page_size, keyword=search)
+
+    def parse_page(response: dict) -> tuple[list, int]:
+        return response['list']['vlist'], response['page']['count']
+
+    if since is not None:
+        videos = fetch_pages_until(fetch_page, parse_page, page_size, lambda v: parse_video(v).pubdate < since)
+    elif use_cache:
+        key = f"user_{uid}_{tid}_{urllib.parse.quote(search, safe='')}"
+        videos = get_listing(key, fetch_page, parse_page, page_size, newest_first=True)
+    else:
+        videos = fetch_pages(fetch_page, parse_page, page_size)
+    for v in videos:
+        yield parse_video(v)
 
 
 def merge_video_lists(*args):
@@ -134,42 +457,207 @@ def video_list_subtract(a: list[Video], b: list[Video]) -> list[Video]:
     return [v for v in a if v.bv not in s]
 
 
+ID_PATTERN = re.compile(rb"BV[a-zA-Z0-9]{10}|av[0-9]+")
+
+
+@span()
+def scan_ids(filename: str) -> list[str]:
+    """
+    Find BV and av ids in one pass over a memory-mapped file. av ids are converted to BV, out of range ones are skipped.
+    """
+    with open(filename, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return []
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            ids = [match.group().decode() for match in ID_PATTERN.finditer(m)]
+    avs = {i: parse_av(match) for i, match in enumerate(ids) if match.startswith("av")}
+    # numbers too large for an av would overflow the batch conversion, they are not video ids anyway
+    av_indices = [i for i, av in avs.items() if av is not None]
+    for i, bv in zip(av_indices, av_to_bv_batch(avs[i] for i in av_indices)):
+        ids[i] = bv
+    return [match for i, match in enumerate(ids) if avs.get(i, 0) is not None]
+
+
+def count_ids(filename: str) -> collections.Counter:
+    return collections.Counter(scan_ids(filename))
+
+
+def build_id_index(filenames: list[str], workers: int = None) -> dict[str, dict[int, int]]:
+    """
+    Scan files in parallel and map each BV to {index of file in filenames: occurrences}.
+    """
+    index: dict[str, dict[int, int]] = {}
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for file_index, counter in enumerate(executor.map(count_ids, filenames)):
+            for bv, count in counter.items():
+                index.setdefault(bv, {})[file_index] = count
+    return index
+
+
 def get_bv_in_file(filename: str) -> Generator:
-    with open(filename, "r") as f:
-        file = f.read()
-        matches = re.findall("BV[a-zA-Z0-9]{10}", file)
-        av_list = re.findall("av[0-9]+", file)
-    for match in matches:
-        yield str(match)
-    for av in av_list:
-        yield av_to_bv(str(av))
-
-
-def duplicate_bv(filename: str, repetitions: int):
-    bv = get_bv_in_file(filename)
-    d = dict(collections.Counter(bv))
-    for k, v in d.items():
-        if v != repetitions:
+    yield from scan_ids(filename)
+
+
+def duplicate_bv(filenames: str | list[str], repetitions: int):
+    if isinstance(filenames, str):
+        filenames = [filenames]
+    for k, v in build_id_index(filenames).items():
+        if sum(v.values()) != repetitions:
             print(k)
 
 
-def bv_subtract(f1: str, f2: str):
-    s1 = set(get_bv_in_file(f1))
-    s2 = set(get_bv_in_file(f2))
-    res = list(s1.difference(s2))
+def bv_difference(index: dict[str, dict[int, int]], file_index: int) -> list[str]:
+    """
+    BVs that appear in the file at file_index and nowhere else.
+    """
+    return [bv for bv, files in index.items() if file_index in files and len(files) == 1]
+
+
+def bv_intersection(index: dict[str, dict[int, int]], file_count: int) -> list[str]:
+    return [bv for bv, files in index.items() if len(files) == file_count]
+
+
+def bv_subtract(f1: str, *others: str):
+    res = bv_difference(build_id_index([f1, *others]), 0)
     print(len(res))
     print(res)
-    print([bv_to_av(b) for b in res])
+    print(bv_to_av_batch(res))
 
 
-def main():
+def bv_intersect(*filenames: str):
+    res = bv_intersection(build_id_index(list(filenames)), len(filenames))
+    print(len(res))
+    print(res)
+
+
+def convert_ids(tokens: Iterable[str]) -> list[Optional[str]]:
+    """
+    Convert av ids to BV and BV ids to av.
+    :return: Converted ids, None for tokens that are neither a valid av nor a valid BV
+    """
+    tokens = list(tokens)
+    result: list[Optional[str]] = [None] * len(tokens)
+    bv_indices = [i for i, t in enumerate(tokens) if is_bv(t)]
+    avs = {i: parse_av(t) for i, t in enumerate(tokens) if not t.startswith("BV")}
+    av_indices = [i for i, av in avs.items() if av is not None]
+    for i, av in zip(bv_indices, bv_to_av_batch(tokens[i] for i in bv_indices)):
+        # BVs decoding to a number that is not an av id are invalid as well
+        if is_valid_av(av):
+            result[i] = "av" + str(av)
+    for i, bv in zip(av_indices, av_to_bv_batch(avs[i] for i in av_indices)):
+        result[i] = bv
+    return result
+
+
+def check_conversion(avs: Iterable[int] = (), bvs: Iterable[str] = ()) -> list[str]:
+    """
+    Check that batch and scalar conversions agree and round trip.
+    Edge values and known pairs are always checked in addition to avs and bvs.
+    :return: Descriptions of the failures
+    """
+    known = {170001: "BV17x411w7KC", 1: "BV1xx411c7mQ", MAX_AV: "BV13F4F1v7vn"}
+    avs = [*known.keys(), 2, MAX_AV - 1, *(int(av) for av in avs)]
+    bvs = [*known.values(), *bvs]
+    failures = [f"av{av} -> {av_to_bv(av)}, expected {bv}" for av, bv in known.items() if av_to_bv(av) != bv]
+    batch_bvs = av_to_bv_batch(avs)
+    for av, bv, round_trip in zip(avs, batch_bvs, bv_to_av_batch(batch_bvs)):
+        if bv != av_to_bv(av) or round_trip != av:
+            failures.append(f"av{av} -> {bv} -> av{round_trip}, scalar {av_to_bv(av)}")
+    for bv, av in zip(bvs, bv_to_av_batch(bvs)):
+        if av != bv_to_av(bv) or av_to_bv(av) != bv:
+            failures.append(f"{bv} -> av{av} -> {av_to_bv(av)}, scalar av{bv_to_av(bv)}")
+    if any(parse_av(token) is not None for token in ("av0", f"av{MAX_AV + 1}", "av29312485965", "foo")):
+        failures.append("out of range av accepted")
+    return failures
+
+
+def check_ids(filenames: list[str], count: int):
+    """
+    Check conversions on edge values, count random avs and BVs found in filenames.
+    """
+    rng = random.Random(0)
+    bvs = [i for filename in filenames for i in scan_ids(filename) if is_bv(i)]
+    avs = [av for av in (rng.randint(1, MAX_AV) for _ in range(count)) if is_valid_av(av)]
+    failures = check_conversion(avs, bvs)
+    for failure in failures:
+        print(failure)
+    print(f"{len(failures)} failures")
+    if len(failures) > 0:
+        sys.exit(1)
+
+
+def benchmark_conversion(count: int):
+    avs = list(range(1, count + 1)) if np is None else np.random.randint(1, 2 ** 29, count, dtype=np.int64)
+    start = time.perf_counter()
+    bvs = av_to_bv_batch(avs)
+    middle = time.perf_counter()
+    bv_to_av_batch(bvs)
+    end = time.perf_counter()
+    print(f"av -> BV: {count / (middle - start):,.0f} ids/s")
+    print(f"BV -> av: {count / (end - middle):,.0f} ids/s")
+    sample = min(count, 100000)
+    start = time.perf_counter()
+    for av in avs[:sample]:
+        bv_to_av(av_to_bv(av))
+    print(f"scalar round trip: {sample / (time.perf_counter() - start):,.0f} ids/s")
+
+
+def fetch_videos(merge: bool = False):
     # s = ChannelSeries(uid=63231, type_=ChannelSeriesType.SERIES, id_=899123)
     # videos = get_videos_in_channel(s)
     # videos2 = filter_videos(get_user_videos(140378), ["翻唱", "V家", "中文版"])
     # videos = merge_video_lists(videos2, videos1)
+    if merge:
+        refresh_video_file(uid=386900246, search="原创")
+        return
     videos = list(get_user_videos(uid=386900246, search="原创"))
     write_videos_to_file(videos)
 
 
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--merge", action="store_true", help="Only add videos newer than those already in the file.")
+    subparsers = parser.add_subparsers(dest="command")
+    convert_parser = subparsers.add_parser("convert", help="Convert av ids to BV and BV ids to av.")
+    convert_parser.add_argument("files", nargs="*", help="Files with whitespace separated ids. Defaults to stdin.")
+    bench_parser = subparsers.add_parser("bench", help="Benchmark batch av/BV conversion.")
+    bench_parser.add_argument("--count", type=int, default=1000000)
+    check_parser = subparsers.add_parser("check", help="Check av/BV conversion on edge values, random ids "
+                                                       "and BVs found in files.")
+    check_parser.add_argument("files", nargs="*")
+    check_parser.add_argument("--count", type=int, default=100000, help="Random avs to check.")
+    duplicates_parser = subparsers.add_parser("duplicates", help="Print ids not occurring exactly n times in total.")
+    duplicates_parser.add_argument("files", nargs="+")
+    duplicates_parser.add_argument("--repetitions", type=int, default=1)
+    subtract_parser = subparsers.add_parser("subtract", help="Print ids in the first file but not in the others.")
+    subtract_parser.add_argument("files", nargs="+")
+    intersect_parser = subparsers.add_parser("intersect", help="Print ids present in every file.")
+    intersect_parser.add_argument("files", nargs="+")
+    args = parser.parse_args()
+    if args.command == "convert":
+        if len(args.files) == 0:
+            tokens = sys.stdin.read().split()
+        else:
+            tokens = [t for filename in args.files for t in open(filename, "r").read().split()]
+        converted = convert_ids(tokens)
+        invalid = [t for t, c in zip(tokens, converted) if c is None]
+        # invalid tokens are echoed so that lines still correspond to the input
+        print("\n".join(t if c is None else c for t, c in zip(tokens, converted)))
+        if len(invalid) > 0:
+            print(f"{len(invalid)} invalid ids: " + " ".join(invalid), file=sys.stderr)
+    elif args.command == "bench":
+        benchmark_conversion(args.count)
+    elif args.command == "check":
+        check_ids(args.files, args.count)
+    elif args.command == "duplicates":
+        duplicate_bv(args.files, args.repetitions)
+    elif args.command == "subtract":
+        bv_subtract(*args.files)
+    elif args.command == "intersect":
+        bv_intersect(*args.files)
+    else:
+        fetch_videos(args.merge)
+
+
 if __name__ == "__main__":
     main()